@@ -1,24 +1,109 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.models import LogEntry, CHANGE
+from django.db.models import Count
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.utils.http import urlencode
 from unfold.admin import ModelAdmin
-from unfold.decorators import display
+from unfold.decorators import display, action
+from unfold.widgets import UnfoldAdminFileFieldWidget, UnfoldAdminSelectWidget
 from .models import Story, Category, Comment, Like, UserProfile
+from .counters import set_comments_active, change_comment_counts, change_like_count, mark_comments_rejected
+from .caching import MODERATION_COUNT_KEY
+from .pagination import KeysetPaginator, InvalidCursor
+from .transfer import (
+    StoryTransfer, CategoryTransfer, CommentTransfer, TransferError,
+    read_rows, write_rows, detect_format, FORMATS, CONTENT_TYPES,
+)
+
+
+class ImportForm(forms.Form):
+    file = forms.FileField(
+        label='Файл', widget=UnfoldAdminFileFieldWidget,
+        help_text='CSV с заголовком или JSON Lines (одна запись в строке)',
+    )
+    format = forms.ChoiceField(
+        label='Формат', required=False, widget=UnfoldAdminSelectWidget,
+        choices=[('', 'По расширению файла'), *((f, f.upper()) for f in FORMATS)],
+    )
+
+
+class TransferAdminMixin:
+    """Экспорт выбранных записей и импорт файла через blog.transfer"""
+    transfer_class = None
+    actions_list = ['import_file']
+    # Сколько причин пропуска строк показывать после импорта
+    skipped_preview = 10
+
+    def export_response(self, queryset, format):
+        transfer = self.transfer_class()
+        rows = write_rows(transfer.export_rows(queryset), list(transfer.columns), format)
+        response = StreamingHttpResponse(rows, content_type=CONTENT_TYPES[format])
+        response['Content-Disposition'] = f'attachment; filename="{self.model._meta.model_name}.{format}"'
+        return response
+
+    @admin.action(description='Экспортировать в CSV')
+    def export_csv(self, request, queryset):
+        return self.export_response(queryset, 'csv')
+
+    @admin.action(description='Экспортировать в JSON Lines')
+    def export_jsonl(self, request, queryset):
+        return self.export_response(queryset, 'jsonl')
+
+    @action(description='Импорт', url_path='import', icon='upload', permissions=['add'])
+    def import_file(self, request):
+        form = ImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            format = form.cleaned_data['format'] or detect_format(upload.name)
+            try:
+                result = self.transfer_class().import_rows(read_rows(upload.file, format))
+            except (TransferError, UnicodeDecodeError) as e:
+                messages.error(request, f'Импорт остановлен: {e}')
+            else:
+                messages.success(
+                    request,
+                    f'Создано: {result.created}, обновлено: {result.updated}, пропущено: {len(result.skipped)}.'
+                )
+                for row_number, reason in result.skipped[:self.skipped_preview]:
+                    messages.warning(request, f'Строка {row_number}: {reason}')
+            opts = self.model._meta
+            return redirect(f'admin:{opts.app_label}_{opts.model_name}_changelist')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': f'Импорт: {self.model._meta.verbose_name_plural}',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/blog/import_form.html', context)
 
 
 @admin.register(Category)
-class CategoryAdmin(ModelAdmin):
+class CategoryAdmin(TransferAdminMixin, ModelAdmin):
+    transfer_class = CategoryTransfer
+    actions = ['export_csv', 'export_jsonl']
     list_display = ['name', 'slug', 'story_count']
     search_fields = ['name']
     prepopulated_fields = {'slug': ('name',)}
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(story_count=Count('stories'))
+
     @display(description='Количество рассказов', ordering='story_count')
     def story_count(self, obj):
-        return obj.stories.count()
+        return obj.story_count
 
 
 @admin.register(Story)
-class StoryAdmin(ModelAdmin):
-    list_display = ['title', 'author', 'category', 'status', 'published_at', 'like_count']
+class StoryAdmin(TransferAdminMixin, ModelAdmin):
+    transfer_class = StoryTransfer
+    actions = ['export_csv', 'export_jsonl']
+    list_display = ['title', 'author', 'category', 'status', 'published_at', 'like_count', 'active_comment_count']
     list_filter = ['status', 'category', 'created_at', 'published_at']
+    list_select_related = ['author', 'category']
     search_fields = ['title', 'content', 'author__username']
     prepopulated_fields = {'slug': ('title',)}
     date_hierarchy = 'published_at'
@@ -36,49 +121,118 @@ class StoryAdmin(ModelAdmin):
             'classes': ('collapse',)
         }),
     )
-    
-    @display(description='Лайков', ordering='like_count')
-    def like_count(self, obj):
-        return obj.likes.count()
 
 
 @admin.register(Comment)
-class CommentAdmin(ModelAdmin):
-    list_display = ['short_content', 'author', 'story', 'created_at', 'is_active']
-    list_filter = ['is_active', 'created_at']
+class CommentAdmin(TransferAdminMixin, ModelAdmin):
+    transfer_class = CommentTransfer
+    actions_list = ['moderation', 'import_file']
+    moderation_per_page = 50
+    moderation_count_key = MODERATION_COUNT_KEY
+    list_display = ['short_content', 'author', 'story', 'created_at', 'is_active', 'is_rejected']
+    list_select_related = ['author', 'story']
+    list_filter = ['is_active', 'is_rejected', 'created_at']
     search_fields = ['content', 'author__username', 'story__title']
     date_hierarchy = 'created_at'
     list_per_page = 30
     
-    actions = ['approve_comments', 'reject_comments']
+    actions = ['approve_comments', 'reject_comments', 'export_csv', 'export_jsonl']
     
     @display(description='Комментарий')
     def short_content(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
     
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            if obj.is_active:
+                change_comment_counts({obj.story_id: 1})
+        elif 'is_active' in form.changed_data:
+            change_comment_counts({obj.story_id: 1 if obj.is_active else -1})
+    
+    @action(description='Модерация', url_path='moderation', icon='fact_check', permissions=['change'])
+    def moderation(self, request):
+        """Очередь неодобренных комментариев с keyset-пагинацией по частичному индексу"""
+        if request.method == 'POST':
+            pending = Comment.objects.filter(
+                pk__in=request.POST.getlist('comment'), is_active=False, is_rejected=False
+            )
+            decision = request.POST.get('decision')
+            if decision in ('approve', 'reject'):
+                # Решения модератора попадают в журнал администратора
+                self.log_moderation(request, pending, 'Одобрен' if decision == 'approve' else 'Отклонён')
+            if decision == 'approve':
+                approved = set_comments_active(pending, True)
+                messages.success(request, f'{approved} комментариев одобрено.')
+            elif decision == 'reject':
+                rejected = mark_comments_rejected(pending)
+                messages.success(request, f'{rejected} комментариев отклонено.')
+            # Возврат на ту же страницу очереди
+            cursor = request.POST.get('cursor')
+            return redirect(f'{request.path}?{urlencode({"cursor": cursor})}' if cursor else request.path)
+
+        queryset = (
+            Comment.objects.filter(is_active=False, is_rejected=False)
+            .select_related('author', 'story')
+            .only('content', 'created_at', 'is_active', 'author__username', 'story__title', 'story__slug')
+        )
+        paginator = KeysetPaginator(
+            queryset, self.moderation_per_page, ('-created_at', '-pk'), count_cache_key=self.moderation_count_key
+        )
+        try:
+            page = paginator.get_page(request.GET.get('cursor'))
+        except InvalidCursor:
+            # Страница опустела после модерации
+            page = paginator.get_page()
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Модерация комментариев',
+            'page_obj': page,
+            'pending_count': paginator.count,
+        }
+        return TemplateResponse(request, 'admin/blog/comment/moderation.html', context)
+
+    def log_moderation(self, request, queryset, message):
+        comments = queryset.select_related('author', 'story').only('author__username', 'story__title')
+        LogEntry.objects.log_actions(request.user.pk, list(comments), CHANGE, message)
+
     @admin.action(description='Одобрить выбранные комментарии')
     def approve_comments(self, request, queryset):
-        updated = queryset.update(is_active=True)
+        self.log_moderation(request, queryset.filter(is_active=False), 'Одобрен')
+        updated = set_comments_active(queryset, True)
         self.message_user(request, f'{updated} комментариев одобрено.')
     
     @admin.action(description='Отклонить выбранные комментарии')
     def reject_comments(self, request, queryset):
-        updated = queryset.update(is_active=False)
+        self.log_moderation(request, queryset.filter(is_rejected=False), 'Отклонён')
+        updated = mark_comments_rejected(queryset)
         self.message_user(request, f'{updated} комментариев отклонено.')
 
 
 @admin.register(Like)
 class LikeAdmin(ModelAdmin):
     list_display = ['user', 'story', 'created_at']
+    list_select_related = ['user', 'story']
     list_filter = ['created_at']
     search_fields = ['user__username', 'story__title']
     date_hierarchy = 'created_at'
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            change_like_count(obj.story_id, 1)
+
 
 @admin.register(UserProfile)
 class UserProfileAdmin(ModelAdmin):
     list_display = ['user', 'get_email', 'get_stories_count']
+    list_select_related = ['user']
     search_fields = ['user__username', 'user__email', 'bio']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(stories_count=Count('user__stories'))
     
     @display(description='Email')
     def get_email(self, obj):
@@ -86,4 +240,4 @@ class UserProfileAdmin(ModelAdmin):
     
     @display(description='Рассказов', ordering='stories_count')
     def get_stories_count(self, obj):
-        return obj.user.stories.count()
+        return obj.stories_count
@@ -0,0 +1,188 @@
+"""
+Асинхронные версии публичных страниц для запуска под ASGI (settings.ASYNC_VIEWS).
+
+Данные читаются асинхронным ORM, независимые запросы страницы (список и число
+рассказов, избранный рассказ, комментарии) запускаются вместе через asyncio.gather.
+Django выполняет запросы одного HTTP-запроса в одном потоке с соединением к БД,
+поэтому они не идут параллельно; выигрыш в том, что ожидание БД и кеша не
+занимает поток сервера. Шаблоны рендерятся в синхронном потоке (TemplateResponse).
+"""
+import asyncio
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Sum
+from django.http import Http404
+from django.shortcuts import aget_object_or_404
+from django.template.response import TemplateResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from .caching import (
+    LISTING_TTL, listing_cache_prefix, story_cache_prefix, listing_cache_key, listing_version, story_version,
+)
+from .models import Story, Category, Comment
+from .page_cache import cache_page_for_anonymous, conditional_page
+from .pagination import KeysetPaginator, InvalidCursor
+from .search import search_stories
+
+
+class AsyncTemplateView(View):
+    template_name = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Асинхронный dispatch нужен декораторам (cache_page_for_anonymous) через method_decorator
+        return await super().dispatch(request, *args, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        context = await self.get_context_data(**kwargs)
+        return TemplateResponse(request, self.template_name, {'view': self, **context})
+
+    async def get_context_data(self, **kwargs):
+        return {}
+
+
+class AsyncStoryListView(AsyncTemplateView):
+    """Список рассказов с теми же переменными шаблона, что у ListView + KeysetPaginationMixin"""
+    paginate_by = None
+    cursor_kwarg = 'cursor'
+    keyset_ordering = ('-published_at', '-pk')
+
+    def _page_context(self, paginator, page):
+        return {
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            'object_list': page.object_list,
+            'stories': page.object_list,
+        }
+
+    async def paginate(self, queryset, count_cache_key=None):
+        paginator = KeysetPaginator(queryset, self.paginate_by, self.keyset_ordering, count_cache_key=count_cache_key)
+        try:
+            page, _ = await asyncio.gather(
+                paginator.aget_page(self.request.GET.get(self.cursor_kwarg)),
+                paginator.acount(),
+            )
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return self._page_context(paginator, page)
+
+    async def paginate_by_number(self, queryset):
+        """Обычная постраничная навигация (результаты поиска)"""
+        paginator = Paginator(queryset, self.paginate_by)
+        paginator.count = await queryset.acount()
+        page_number = self.request.GET.get('page') or 1
+        if page_number == 'last':
+            page_number = paginator.num_pages
+        try:
+            page = paginator.page(page_number)
+        except InvalidPage as e:
+            raise Http404(str(e))
+        page.object_list = [story async for story in page.object_list]
+        return self._page_context(paginator, page)
+
+
+@method_decorator(
+    [conditional_page(listing_version), cache_page_for_anonymous(LISTING_TTL, listing_cache_prefix)], name='dispatch'
+)
+class StoryListView(AsyncStoryListView):
+    template_name = 'blog/story_list.html'
+    paginate_by = 6
+
+    async def get_context_data(self, **kwargs):
+        query = self.request.GET.get('q')
+        stories = Story.published.for_cards()
+        if query and query.strip():
+            # Результаты поиска отсортированы по релевантности, для них обычная пагинация
+            pagination = self.paginate_by_number(search_stories(stories, query))
+        else:
+            count_cache_key = await sync_to_async(listing_cache_key)('count:all')
+            pagination = self.paginate(stories.order_by('-published_at', '-pk'), count_cache_key)
+
+        featured = Story.published.for_cards().order_by('-published_at', '-pk').afirst()
+        context, featured_story = await asyncio.gather(pagination, featured)
+        context['featured_story'] = featured_story
+        return context
+
+
+@method_decorator(
+    [conditional_page(story_version), cache_page_for_anonymous(60 * 3, story_cache_prefix)], name='dispatch'
+)
+class StoryDetailView(AsyncTemplateView):
+    template_name = 'blog/story_detail.html'
+    comments_per_page = 10
+
+    async def get_context_data(self, slug, **kwargs):
+        story_query = Story.published.select_related('author__profile', 'category').defer('content')
+        comments = Comment.objects.filter(
+            story__slug=slug, story__status=Story.Status.PUBLISHED, is_active=True
+        ).select_related('author__profile')
+
+        # Номер страницы неизвестен до подсчёта комментариев, поэтому строки
+        # запрашиваются для запрошенной страницы сразу, а при выходе за пределы
+        # (как Paginator.get_page) — повторно для последней
+        try:
+            number = max(int(self.request.GET.get('page')), 1)
+        except (TypeError, ValueError):
+            number = 1
+        offset = (number - 1) * self.comments_per_page
+        try:
+            story, count, rows = await asyncio.gather(
+                story_query.aget(slug=slug),
+                comments.acount(),
+                self.fetch(comments[offset:offset + self.comments_per_page]),
+            )
+        except Story.DoesNotExist:
+            raise Http404('Рассказ не найден')
+
+        paginator = Paginator(comments, self.comments_per_page)
+        paginator.count = count
+        page = paginator.get_page(number)
+        page.object_list = rows if page.number == number else await self.fetch(page.object_list)
+
+        return {
+            'object': story,
+            'story': story,
+            'comments': page,
+            # Состояние лайка и форма комментария рендерятся фрагментами (blog.page_cache)
+            'like_count': story.like_count,
+        }
+
+    async def fetch(self, queryset):
+        return [obj async for obj in queryset]
+
+
+@method_decorator(conditional_page(listing_version), name='dispatch')
+class UserStoryListView(AsyncStoryListView):
+    template_name = 'blog/user_stories.html'
+    paginate_by = 5
+
+    async def get_context_data(self, username, **kwargs):
+        author = await aget_object_or_404(User.objects.select_related('profile'), username=username)
+        published = Story.published.filter(author=author)
+        count_cache_key = await sync_to_async(listing_cache_key)(f'count:author:{author.pk}')
+        context, totals = await asyncio.gather(
+            self.paginate(
+                Story.published.for_cards().filter(author=author).order_by('-published_at', '-pk'), count_cache_key
+            ),
+            published.aaggregate(total_likes=Sum('like_count'), total_comments=Sum('active_comment_count')),
+        )
+        context.update(totals, author=author)
+        return context
+
+
+@method_decorator(
+    [conditional_page(listing_version), cache_page_for_anonymous(LISTING_TTL, listing_cache_prefix)], name='dispatch'
+)
+class CategoryStoryListView(AsyncStoryListView):
+    template_name = 'blog/category_stories.html'
+    paginate_by = 5
+
+    async def get_context_data(self, slug, **kwargs):
+        category = await aget_object_or_404(Category, slug=slug)
+        count_cache_key = await sync_to_async(listing_cache_key)(f'count:category:{category.pk}')
+        context = await self.paginate(
+            Story.published.for_cards().filter(category=category).order_by('-published_at', '-pk'), count_cache_key
+        )
+        context['category'] = category
+        return context
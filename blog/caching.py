@@ -0,0 +1,135 @@
+"""
+Версионированные ключи кеша.
+
+Каждый рассказ и все списки рассказов имеют номер версии в общем кеше.
+Изменение рассказа, лайк или комментарий меняют номер, и старые записи
+просто перестают читаться во всех процессах, без удаления ключей по одному.
+Лайки меняют только версию рассказа: число лайков в карточках списков
+обновляется не позже чем через LISTING_TTL.
+"""
+import time
+from django.core.cache import cache
+
+
+LISTING_GENERATION_KEY = 'blog:listing:generation'
+# Ленты (blog.feeds) не выводят лайки и комментарии, поэтому у них своё поколение,
+# которое меняется только вместе с составом или текстом опубликованных рассказов
+FEED_GENERATION_KEY = 'blog:feed:generation'
+# Сколько живут закешированные списки и их ETag без смены поколения
+LISTING_TTL = 60 * 5
+# Число комментариев в очереди модерации (CommentAdmin.moderation)
+MODERATION_COUNT_KEY = 'blog:moderation:pending-count'
+
+
+def _story_version_key(pk):
+    return f'blog:story:{pk}:version'
+
+
+def _slug_key(slug):
+    return f'blog:slug:{slug}'
+
+
+def _new_version():
+    # Новое значение всегда больше прежнего, даже если ключ был вытеснен из кеша
+    return time.time_ns()
+
+
+def _get_or_init(key):
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_listing_generation():
+    return _get_or_init(LISTING_GENERATION_KEY)
+
+
+def bump_listing_generation():
+    cache.set(LISTING_GENERATION_KEY, _new_version(), None)
+
+
+def get_feed_generation():
+    return _get_or_init(FEED_GENERATION_KEY)
+
+
+def bump_feed_generation():
+    cache.set(FEED_GENERATION_KEY, _new_version(), None)
+
+
+def get_story_version(pk):
+    return _get_or_init(_story_version_key(pk))
+
+
+def bump_story_versions(pks):
+    """Меняет версии нескольких рассказов за одно обращение к кешу"""
+    version = _new_version()
+    cache.set_many({_story_version_key(pk): version for pk in pks}, None)
+
+
+def bump_story_version(pk):
+    bump_story_versions([pk])
+
+
+def remember_story_slug(slug, pk):
+    cache.set(_slug_key(slug), pk, None)
+
+
+def forget_story_slug(slug):
+    cache.delete(_slug_key(slug))
+
+
+def forget_moderation_count():
+    cache.delete(MODERATION_COUNT_KEY)
+
+
+def get_story_pk(slug):
+    """pk рассказа по слагу; отображение хранится в кеше и обновляется при сохранении"""
+    pk = cache.get(_slug_key(slug))
+    if pk is None:
+        from .models import Story
+        pk = Story.objects.filter(slug=slug).values_list('pk', flat=True).first()
+        if pk is not None:
+            remember_story_slug(slug, pk)
+    return pk
+
+
+def listing_cache_prefix(request, *args, **kwargs):
+    return f'blog.listing.{get_listing_generation()}'
+
+
+def feed_cache_prefix(request, *args, **kwargs):
+    return f'blog.feed.{get_feed_generation()}'
+
+
+def story_cache_prefix(request, slug, *args, **kwargs):
+    pk = get_story_pk(slug)
+    if pk is None:
+        return 'blog.story.missing'
+    return f'blog.story.{pk}.{get_story_version(pk)}'
+
+
+# Версии для условных запросов (blog.page_cache.conditional_page). Версия —
+# время последнего изменения в наносекундах, из неё же берётся Last-Modified
+
+def listing_version(request, *args, **kwargs):
+    # Версия растёт хотя бы раз в LISTING_TTL, поэтому 304 на список
+    # с устаревшими счётчиками отдаётся не дольше, чем живёт кеш страницы
+    period = LISTING_TTL * 10 ** 9
+    return max(get_listing_generation(), time.time_ns() // period * period)
+
+
+def feed_version(request, *args, **kwargs):
+    return get_feed_generation()
+
+
+def story_version(request, slug, *args, **kwargs):
+    pk = get_story_pk(slug)
+    return None if pk is None else get_story_version(pk)
+
+
+def listing_cache_key(name):
+    """Ключ для данных, зависящих от списков рассказов (например, счётчиков)"""
+    return f'blog:listing:{get_listing_generation()}:{name}'
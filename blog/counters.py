@@ -0,0 +1,122 @@
+"""Денормализованные счётчики лайков и одобренных комментариев рассказа"""
+from collections import defaultdict
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from .models import Story, Comment, Like
+from .caching import bump_story_version, bump_story_versions, bump_listing_generation, forget_moderation_count
+from .stats import change_counters
+
+
+def _shifted(field, delta):
+    return Greatest(F(field) + delta, Value(0))
+
+
+def change_like_count(story_id, delta):
+    Story.objects.filter(pk=story_id).update(like_count=_shifted('like_count', delta))
+    change_counters({'total_likes': delta})
+    # Карточки в списках ключуются по like_count, а сами списки живут LISTING_TTL,
+    # поэтому поколение списков не сбрасывается на каждый лайк
+    bump_story_version(story_id)
+
+
+def add_like(story_id, user):
+    """
+    Ставит лайк, если его ещё нет; возвращает True, если лайк добавлен.
+    Повторный запрос (двойной клик) упирается в уникальный индекс (story, user)
+    вместо гонки get_or_create. Статистику по дням меняет обработчик post_save.
+    """
+    try:
+        with transaction.atomic():
+            Like.objects.create(story_id=story_id, user=user)
+    except IntegrityError:
+        return False
+    change_like_count(story_id, 1)
+    return True
+
+
+@transaction.atomic
+def remove_like(story_id, user):
+    """
+    Снимает лайк; возвращает True, если он был. Счётчики и статистику по дням
+    меняют обработчики post_delete. Строка блокируется до конца транзакции,
+    поэтому параллельный запрос её уже не найдёт и не уменьшит счётчики дважды.
+    """
+    likes = Like.objects.filter(story_id=story_id, user=user)
+    if not list(likes.select_for_update().values_list('pk', flat=True)):
+        return False
+    deleted, _ = likes.delete()
+    return deleted > 0
+
+
+def change_comment_counts(deltas):
+    """Применяет изменения вида {story_id: delta}, по одному UPDATE на каждое значение delta"""
+    by_delta = defaultdict(list)
+    for story_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(story_id)
+    for delta, story_ids in by_delta.items():
+        Story.objects.filter(pk__in=story_ids).update(
+            active_comment_count=_shifted('active_comment_count', delta)
+        )
+    if by_delta:
+        bump_story_versions([story_id for story_id, delta in deltas.items() if delta])
+        change_counters({'comments': sum(deltas.values())})
+
+
+@transaction.atomic
+def set_comments_active(queryset, is_active):
+    """Одобряет или скрывает комментарии и пересчитывает счётчики затронутых рассказов"""
+    to_change = queryset.exclude(is_active=is_active)
+    per_story = dict(
+        to_change.order_by().values_list('story_id').annotate(total=Count('pk'))
+    )
+    if not per_story:
+        return 0
+    fields = {'is_active': is_active}
+    if is_active:
+        # Одобренный комментарий перестаёт быть отклонённым
+        fields['is_rejected'] = False
+    updated = to_change.update(**fields)
+    forget_moderation_count()
+    sign = 1 if is_active else -1
+    change_comment_counts({story_id: sign * total for story_id, total in per_story.items()})
+    return updated
+
+
+@transaction.atomic
+def mark_comments_rejected(queryset):
+    """
+    Скрывает комментарии и помечает их отклонёнными. Записи остаются в базе,
+    поэтому решение модератора можно пересмотреть, а статистика по дням не меняется.
+    """
+    set_comments_active(queryset, False)
+    rejected = queryset.filter(is_rejected=False).update(is_rejected=True)
+    if rejected:
+        forget_moderation_count()
+    return rejected
+
+
+def _count_subquery(model, **filters):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(story=OuterRef('pk'), **filters)
+            .order_by()
+            .values('story')
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def reconcile_counters(story_pks):
+    """Пересчитывает счётчики рассказов из дочерних таблиц одним UPDATE"""
+    updated = Story.objects.filter(pk__in=story_pks).update(
+        like_count=_count_subquery(Like),
+        active_comment_count=_count_subquery(Comment, is_active=True),
+    )
+    bump_story_versions(story_pks)
+    bump_listing_generation()
+    return updated
@@ -0,0 +1,148 @@
+"""
+Ленты RSS и Atom: все рассказы, категория, автор.
+
+Текст берётся из сохранённых content_html и plain_excerpt, Markdown не
+рендерится. Готовая лента кешируется до следующей публикации (поколение
+лент в blog.caching) и поддерживает условные запросы, поэтому опрос ленты
+агрегатором обычно не доходит до БД.
+"""
+from django.contrib.auth.models import User
+from django.contrib.syndication.views import Feed
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+from .caching import feed_cache_prefix, feed_version
+from .models import Story, Category
+from .page_cache import cache_page_for_anonymous, conditional_page
+
+
+FEED_SIZE = 20
+FEED_CACHE_TIMEOUT = 60 * 30
+SITE_NAME = 'Интрига'
+
+
+class ContentRssFeed(Rss201rev2Feed):
+    """RSS 2.0 с полным текстом рассказа в content:encoded"""
+
+    def rss_attributes(self):
+        attrs = super().rss_attributes()
+        attrs['xmlns:content'] = 'http://purl.org/rss/1.0/modules/content/'
+        return attrs
+
+    def add_item_elements(self, handler, item):
+        super().add_item_elements(handler, item)
+        if item.get('content'):
+            handler.addQuickElement('content:encoded', item['content'])
+
+
+class ContentAtomFeed(Atom1Feed):
+    """Atom с полным текстом рассказа в content"""
+
+    def add_item_elements(self, handler, item):
+        super().add_item_elements(handler, item)
+        if item.get('content'):
+            handler.addQuickElement('content', item['content'], {'type': 'html'})
+
+
+class StoryFeed(Feed):
+    feed_type = ContentRssFeed
+    title = f'{SITE_NAME} — новые рассказы'
+    description = 'Последние опубликованные рассказы'
+
+    def link(self):
+        return reverse('blog:story_list')
+
+    def get_queryset(self, obj):
+        return Story.published.all()
+
+    def items(self, obj):
+        return (
+            self.get_queryset(obj)
+            .select_related('author', 'category')
+            .defer('content', 'search_vector')
+            .order_by('-published_at', '-pk')[:FEED_SIZE]
+        )
+
+    def item_title(self, item):
+        return item.title
+
+    def item_description(self, item):
+        return item.plain_excerpt
+
+    def item_extra_kwargs(self, item):
+        return {'content': item.content_html}
+
+    def item_pubdate(self, item):
+        return item.published_at
+
+    def item_updateddate(self, item):
+        return item.updated_at
+
+    def item_author_name(self, item):
+        return item.author.username
+
+    def item_categories(self, item):
+        return [item.category.name] if item.category else []
+
+
+class CategoryFeed(StoryFeed):
+    def get_object(self, request, slug):
+        return get_object_or_404(Category, slug=slug)
+
+    def title(self, obj):
+        return f'{SITE_NAME} — {obj.name}'
+
+    def description(self, obj):
+        return f'Последние рассказы в категории «{obj.name}»'
+
+    def link(self, obj):
+        return reverse('blog:category_stories', args=[obj.slug])
+
+    def get_queryset(self, obj):
+        return Story.published.filter(category=obj)
+
+
+class AuthorFeed(StoryFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, obj):
+        return f'{SITE_NAME} — рассказы {obj.username}'
+
+    def description(self, obj):
+        return f'Последние рассказы автора {obj.username}'
+
+    def link(self, obj):
+        return reverse('blog:user_stories', args=[obj.username])
+
+    def get_queryset(self, obj):
+        return Story.published.filter(author=obj)
+
+
+class AtomStoryFeed(StoryFeed):
+    feed_type = ContentAtomFeed
+    subtitle = StoryFeed.description
+
+
+class AtomCategoryFeed(CategoryFeed):
+    feed_type = ContentAtomFeed
+    subtitle = CategoryFeed.description
+
+
+class AtomAuthorFeed(AuthorFeed):
+    feed_type = ContentAtomFeed
+    subtitle = AuthorFeed.description
+
+
+def feed_view(feed_class):
+    return conditional_page(feed_version)(
+        cache_page_for_anonymous(FEED_CACHE_TIMEOUT, feed_cache_prefix)(feed_class())
+    )
+
+
+story_rss = feed_view(StoryFeed)
+story_atom = feed_view(AtomStoryFeed)
+category_rss = feed_view(CategoryFeed)
+category_atom = feed_view(AtomCategoryFeed)
+author_rss = feed_view(AuthorFeed)
+author_atom = feed_view(AtomAuthorFeed)
@@ -0,0 +1,140 @@
+"""
+Варианты изображений imagekit.
+
+Файлы создаются в фоне при сохранении исходного изображения
+(BackgroundOptimistic) или командой warm_covers, а при рендере страницы
+только строится URL — обработка изображений в запросе не выполняется.
+
+Фоновая задача теряется, если процесс перезапустится раньше, чем она
+выполнится, поэтому страницы ссылаются только на варианты, созданные
+по данным кеша imagekit (ready_specs), а вместо остальных выводят исходное
+изображение и снова ставят их создание в фон.
+"""
+from django.core.files import File
+from imagekit.cachefiles.backends import CacheFileState
+from imagekit.models import ImageSpecField
+from imagekit.processors import ResizeToFill
+from imagekit.utils import get_cache
+from .tasks import run_in_background
+
+
+# Сколько вариант считается создаваемым: после этого отсутствующий файл
+# снова ставится в очередь при следующем показе
+GENERATION_TIMEOUT = 60 * 10
+
+
+class BackgroundOptimistic:
+    """Как imagekit Optimistic, но генерация идёт в фоновом потоке, а не в save()"""
+
+    def on_source_saved(self, file):
+        schedule_generation(file)
+
+    def should_verify_existence(self, file):
+        return False
+
+
+def _mark_generating(file):
+    backend = file.cachefile_backend
+    backend.cache.set(backend.get_key(file), CacheFileState.GENERATING, GENERATION_TIMEOUT)
+
+
+def schedule_generation(file):
+    _mark_generating(file)
+    run_in_background(generate_detached, file)
+
+
+def generate_detached(file):
+    # Варианты одного исходника создаются в разных потоках, а объект исходного
+    # файла у них общий: каждому потоку нужен собственный дескриптор
+    spec = file.generator
+    source = spec.source
+    try:
+        with source.storage.open(source.name, 'rb') as own_source:
+            spec.source = File(own_source, name=source.name)
+            # Состояние GENERATING выставлено при постановке в очередь
+            file.generate(force=True)
+    except Exception:
+        # Иначе вариант навсегда останется «создаваемым»; повтор — через GENERATION_TIMEOUT
+        _mark_generating(file)
+        raise
+
+
+def ready_specs(instance, spec_names):
+    """
+    Имена вариантов, файлы которых уже созданы. Состояния читаются из кеша
+    imagekit одним get_many, хранилище проверяется только для неизвестных.
+    Отсутствующие варианты снова ставятся в фон.
+    """
+    files = {name: getattr(instance, name) for name in spec_names}
+    keys = {name: file.cachefile_backend.get_key(file) for name, file in files.items()}
+    states = get_cache().get_many(list(keys.values()))
+    ready = set()
+    for name, file in files.items():
+        state = states.get(keys[name]) or file.cachefile_backend.get_state(file)
+        if state == CacheFileState.EXISTS:
+            ready.add(name)
+        elif state == CacheFileState.DOES_NOT_EXIST:
+            schedule_generation(file)
+    return ready
+
+
+# Ширины для srcset; пропорции 2:1, как у основной миниатюры 800x400
+COVER_WIDTHS = (400, 800, 1600)
+# Порядок важен: браузер берёт первый поддерживаемый <source>
+COVER_FORMATS = {
+    'avif': ('image/avif', 'AVIF', {'quality': 50}),
+    'webp': ('image/webp', 'WEBP', {'quality': 75}),
+}
+
+
+def cover_variant(width, suffix):
+    _, format, options = COVER_FORMATS[suffix]
+    return ImageSpecField(
+        source='cover_image',
+        processors=[ResizeToFill(width, width // 2)],
+        format=format,
+        options=options,
+    )
+
+
+def cover_variant_name(suffix, width):
+    return f'cover_{suffix}_{width}'
+
+
+# Квадратные аватары; в шаблонах выбираются через get_avatar_url(size)
+AVATAR_SIZES = (32, 64, 128)
+
+
+def avatar_variant(size):
+    return ImageSpecField(
+        source='avatar',
+        processors=[ResizeToFill(size, size)],
+        format='WEBP',
+        options={'quality': 80},
+    )
+
+
+def avatar_variant_name(size):
+    return f'avatar_{size}'
+
+
+def generate_image_specs(instance, spec_names, force=False):
+    for name in spec_names:
+        getattr(instance, name).generate(force=force)
+
+
+def warm_image_specs(model_label, source_field, file_names, force=False):
+    """
+    Создаёт варианты для списка исходных файлов; выполняется в пуле процессов.
+    Экземпляры модели не сохраняются, поэтому БД не используется.
+    """
+    from django.apps import apps
+    model = apps.get_model(model_label)
+    spec_names = model.IMAGE_SPEC_FIELDS[source_field]
+    failed = []
+    for name in file_names:
+        try:
+            generate_image_specs(model(**{source_field: name}), spec_names, force)
+        except Exception:
+            failed.append(name)
+    return len(file_names) - len(failed), failed
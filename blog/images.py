@@ -0,0 +1,46 @@
+"""
+Нормализация загруженных изображений.
+
+Перед сохранением обложка или аватар перекодируются в WebP: ориентация
+из EXIF применяется к пикселям, метаданные (EXIF, GPS, XMP) отбрасываются,
+размер ограничивается по длинной стороне. JPEG декодируется сразу
+в уменьшенном масштабе (draft), поэтому фото с телефона не распаковывается
+в память целиком.
+"""
+import os
+from io import BytesIO
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+
+COVER_MAX_SIZE = 2400
+AVATAR_MAX_SIZE = 512
+WEBP_QUALITY = 82
+
+
+def normalize_image(file, max_size, quality=WEBP_QUALITY):
+    """Возвращает (ContentFile в WebP, ширина, высота)"""
+    file.seek(0)
+    with Image.open(file) as source:
+        source.draft(None, (max_size, max_size))
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        buffer = BytesIO()
+        # Цветовой профиль не метаданные: без него изменятся цвета
+        image.save(buffer, 'WEBP', quality=quality, method=4, icc_profile=source.info.get('icc_profile'))
+
+    stem = os.path.splitext(os.path.basename(file.name or 'image'))[0]
+    return ContentFile(buffer.getvalue(), name=f'{stem}.webp'), image.width, image.height
+
+
+def normalize_field_file(field_file, max_size):
+    """Заменяет ещё не сохранённый файл поля нормализованным, возвращает (ширина, высота)"""
+    content, width, height = normalize_image(field_file.file, max_size)
+    field_file.file = content
+    field_file.name = content.name
+    return width, height
@@ -0,0 +1,45 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from blog.imagegenerators import warm_image_specs
+
+
+class WarmImagesCommand(BaseCommand):
+    """Общая часть команд, создающих варианты изображений в нескольких процессах"""
+    model = None
+    source_field = None
+    result_message = 'Обработано изображений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Количество процессов')
+        parser.add_argument('--chunk-size', type=int, default=20, help='Количество изображений на одно задание')
+        parser.add_argument('--force', action='store_true', help='Пересоздать уже существующие файлы')
+
+    def handle(self, *args, **options):
+        names = list(
+            self.model.objects.exclude(**{self.source_field: ''}).exclude(**{f'{self.source_field}__isnull': True})
+            .order_by().values_list(self.source_field, flat=True).distinct()
+        )
+        chunk_size = options['chunk_size']
+        chunks = [names[i:i + chunk_size] for i in range(0, len(names), chunk_size)]
+
+        # Дочерние процессы не должны унаследовать открытое соединение с БД
+        connections.close_all()
+
+        done = 0
+        failed = []
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            results = pool.map(
+                warm_image_specs, repeat(self.model._meta.label), repeat(self.source_field), chunks,
+                repeat(options['force'])
+            )
+            for chunk_done, chunk_failed in results:
+                done += chunk_done
+                failed.extend(chunk_failed)
+
+        for name in failed:
+            self.stderr.write(f'Не удалось обработать {name}')
+        self.stdout.write(self.style.SUCCESS(f'{self.result_message}: {done}, с ошибками: {len(failed)}.'))
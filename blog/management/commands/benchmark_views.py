@@ -0,0 +1,164 @@
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+from django.urls import reverse
+from blog.models import Story
+
+
+MODES = ('wsgi', 'asgi')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность публичных страниц: синхронные представления '
+        'через WSGI и асинхронные (ASYNC_VIEWS) через ASGI. Запросы идут прямо в '
+        'обработчики Django, без сети, каждый режим — в отдельном процессе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Запросов на каждый режим')
+        parser.add_argument('--concurrency', type=int, default=20, help='Одновременных запросов')
+        parser.add_argument('--url', action='append', dest='urls', help='Адрес страницы (можно указать несколько раз)')
+        parser.add_argument('--host', default='localhost', help='Заголовок Host (должен быть в ALLOWED_HOSTS)')
+        parser.add_argument(
+            '--page-cache', action='store_true',
+            help='Оставить настроенный кеш; по умолчанию он отключён, чтобы измерять сами представления',
+        )
+        parser.add_argument('--mode', choices=MODES, help='Запустить только один режим в текущем процессе')
+
+    def handle(self, *args, **options):
+        urls = options['urls'] or self.default_urls()
+        if options['mode']:
+            result = self.run_mode(options['mode'], urls, options)
+            self.stdout.write(json.dumps(result))
+            return
+
+        results = [self.spawn(mode, urls, options) for mode in MODES]
+        self.stdout.write(f'Страницы: {", ".join(urls)}')
+        self.stdout.write(f'{"режим":<6} {"запросов/с":>11} {"p50, мс":>9} {"p95, мс":>9} {"ошибок":>7}')
+        for result in results:
+            self.stdout.write(
+                f'{result["mode"]:<6} {result["rps"]:>11.1f} {result["p50"]:>9.1f} {result["p95"]:>9.1f} {result["errors"]:>7}'
+            )
+
+    def default_urls(self):
+        story = Story.published.select_related('author', 'category').order_by('-published_at').first()
+        if story is None:
+            raise CommandError('Нет опубликованных рассказов, укажите адреса через --url')
+        urls = [reverse('blog:story_list'), story.get_absolute_url(), reverse('blog:user_stories', args=[story.author.username])]
+        if story.category is not None:
+            urls.append(reverse('blog:category_stories', args=[story.category.slug]))
+        return urls
+
+    def spawn(self, mode, urls, options):
+        """Режим определяет, какие представления подключены в blog.urls, поэтому нужен новый процесс"""
+        command = [
+            sys.executable, sys.argv[0], 'benchmark_views', '--mode', mode,
+            '--requests', str(options['requests']), '--concurrency', str(options['concurrency']),
+            '--host', options['host'],
+        ]
+        for url in urls:
+            command += ['--url', url]
+        if options['page_cache']:
+            command.append('--page-cache')
+        env = {**os.environ, 'ASYNC_VIEWS': str(mode == 'asgi')}
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode:
+            raise CommandError(f'Режим {mode} завершился с ошибкой:\n{completed.stderr}')
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def run_mode(self, mode, urls, options):
+        if (mode == 'asgi') != settings.ASYNC_VIEWS:
+            raise CommandError(f'Для режима {mode} нужно ASYNC_VIEWS={mode == "asgi"}')
+        paths = [urls[i % len(urls)] for i in range(options['requests'])]
+        overrides = {}
+        if not options['page_cache']:
+            overrides['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+        with override_settings(**overrides):
+            started = time.perf_counter()
+            if mode == 'wsgi':
+                timings = self.run_wsgi(paths, options['host'], options['concurrency'])
+            else:
+                timings = asyncio.run(self.run_asgi(paths, options['host'], options['concurrency']))
+            elapsed = time.perf_counter() - started
+
+        durations = sorted(duration for duration, _ in timings)
+        return {
+            'mode': mode,
+            'rps': len(timings) / elapsed,
+            'p50': statistics.median(durations) * 1000,
+            'p95': durations[int(len(durations) * 0.95) - 1] * 1000,
+            'errors': sum(1 for _, status in timings if status != 200),
+        }
+
+    def run_wsgi(self, paths, host, concurrency):
+        application = get_wsgi_application()
+
+        def request(url):
+            path, _, query = url.partition('?')
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+                'SERVER_NAME': host, 'SERVER_PORT': '80', 'HTTP_HOST': host, 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'wsgi.url_scheme': 'http', 'wsgi.input': BytesIO(), 'wsgi.errors': sys.stderr,
+                'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+                'wsgi.version': (1, 0),
+            }
+            statuses = []
+            started = time.perf_counter()
+            response = application(environ, lambda status, headers: statuses.append(int(status.split()[0])))
+            try:
+                for _ in response:
+                    pass
+            finally:
+                response.close()
+            return time.perf_counter() - started, statuses[0]
+
+        # Как синхронный сервер с потоками: один поток на одновременный запрос
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(request, paths))
+
+    async def run_asgi(self, paths, host, concurrency):
+        application = get_asgi_application()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request(url):
+            path, _, query = url.partition('?')
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                'root_path': '', 'headers': [(b'host', host.encode())],
+                'server': (host, 80), 'client': ('127.0.0.1', 0),
+            }
+            body_sent = False
+            statuses = []
+
+            async def receive():
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # Клиент не отключается; Django отменит ожидание после ответа
+                await asyncio.Event().wait()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+
+            async with semaphore:
+                started = time.perf_counter()
+                await application(scope, receive, send)
+                return time.perf_counter() - started, statuses[0]
+
+        return await asyncio.gather(*(request(url) for url in paths))
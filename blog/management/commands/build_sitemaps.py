@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from blog.sitemaps import build_sitemaps
+
+
+class Command(BaseCommand):
+    help = 'Строит файлы карты сайта (sitemap.xml и его части) заново; публикации обновляют их сами'
+
+    def handle(self, *args, **options):
+        totals = build_sitemaps()
+        values = ', '.join(f'{section}={count}' for section, count in totals.items())
+        self.stdout.write(self.style.SUCCESS(f'Карта сайта построена: {values}.'))
@@ -0,0 +1,33 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from blog.transfer import StoryTransfer, TransferError, read_rows, detect_format, FORMATS, CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует рассказы из CSV или JSON Lines пачками. Поля: title, content, author (логин), '
+        'необязательные slug (для обновления существующих), excerpt, category (название), '
+        'status (DF/PB), published_at (ISO 8601)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу или «-» для стандартного ввода')
+        parser.add_argument('--format', choices=FORMATS, help='Формат файла; по умолчанию по расширению, иначе jsonl')
+        parser.add_argument('--batch-size', type=int, default=CHUNK_SIZE, help='Количество рассказов в одной пачке')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or detect_format(path)
+        source = sys.stdin if path == '-' else open(path, encoding='utf-8-sig', newline='')
+
+        with source:
+            try:
+                result = StoryTransfer().import_rows(read_rows(source, format), options['batch_size'])
+            except TransferError as e:
+                raise CommandError(str(e))
+
+        for row_number, reason in result.skipped:
+            self.stderr.write(f'Строка {row_number} пропущена: {reason}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано рассказов: {result.created}, обновлено: {result.updated}, пропущено: {len(result.skipped)}.'
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from blog.models import Story
+from blog import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый поисковый индекс рассказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Количество рассказов в одной пачке')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = 0
+        indexed = 0
+
+        while True:
+            pks = list(
+                Story.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+            last_pk = pks[-1]
+            search.index_stories(Story, pks)
+            indexed += len(pks)
+
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано рассказов: {indexed}.'))
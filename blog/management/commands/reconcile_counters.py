@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from blog.models import Story
+from blog.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики лайков и одобренных комментариев рассказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Количество рассказов в одном UPDATE')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = 0
+        total = 0
+
+        while True:
+            pks = list(
+                Story.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+            last_pk = pks[-1]
+            total += reconcile_counters(pks)
+
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано рассказов: {total}.'))
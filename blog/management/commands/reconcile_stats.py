@@ -0,0 +1,18 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from blog.stats import reconcile_counters, rebuild_daily
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики и статистику по дням для панели администратора (запускать по расписанию)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='За сколько последних дней пересчитать статистику; 0 — за всё время')
+
+    def handle(self, *args, **options):
+        counters = reconcile_counters()
+        since = timezone.localdate() - timedelta(days=options['days'] - 1) if options['days'] else None
+        rows = rebuild_daily(since)
+        values = ', '.join(f'{name}={value}' for name, value in counters.items())
+        self.stdout.write(self.style.SUCCESS(f'Счётчики: {values}. Строк статистики по дням: {rows}.'))
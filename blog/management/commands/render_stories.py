@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from blog.caching import bump_story_versions, bump_listing_generation, bump_feed_generation
+from blog.models import Story
+
+
+class Command(BaseCommand):
+    help = 'Заполняет сохранённый HTML и текстовые превью рассказов (после изменения MARKDOWNX_MARKDOWN_EXTENSIONS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Количество рассказов в одной пачке')
+        parser.add_argument('--force', action='store_true', help='Перерендерить все рассказы, даже актуальные')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        force = options['force']
+        fields = ['pk', 'status', 'content', 'excerpt', 'updated_at', *Story.RENDERED_FIELDS]
+        last_pk = 0
+        checked = rendered = 0
+        published_changed = False
+
+        while True:
+            batch = list(
+                Story.objects.filter(pk__gt=last_pk).order_by('pk').only(*fields)[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            checked += len(batch)
+
+            changed = []
+            for story in batch:
+                rendered_now = story.render_content(force=force)
+                if story.refresh_plain_excerpt() or rendered_now:
+                    changed.append(story)
+            if changed:
+                # updated_at входит в ключи карточек и в lastmod карты сайта
+                now = timezone.now()
+                for story in changed:
+                    story.updated_at = now
+                Story.objects.bulk_update(changed, [*Story.RENDERED_FIELDS, 'updated_at'])
+                rendered += len(changed)
+                # bulk_update не вызывает post_save: кеши сбрасываются так же, как в invalidate_story_caches
+                bump_story_versions([story.pk for story in changed])
+                published_changed = published_changed or any(
+                    story.status == Story.Status.PUBLISHED for story in changed
+                )
+
+        if published_changed:
+            bump_listing_generation()
+            bump_feed_generation()
+
+        self.stdout.write(self.style.SUCCESS(f'Проверено рассказов: {checked}, обновлено: {rendered}.'))
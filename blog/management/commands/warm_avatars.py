@@ -0,0 +1,9 @@
+from blog.models import UserProfile
+from blog.management.base import WarmImagesCommand
+
+
+class Command(WarmImagesCommand):
+    help = 'Создаёт уменьшенные аватары всех профилей в нескольких процессах'
+    model = UserProfile
+    source_field = 'avatar'
+    result_message = 'Обработано аватаров'
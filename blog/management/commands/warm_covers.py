@@ -0,0 +1,9 @@
+from blog.models import Story
+from blog.management.base import WarmImagesCommand
+
+
+class Command(WarmImagesCommand):
+    help = 'Создаёт миниатюры и варианты обложек всех рассказов в нескольких процессах'
+    model = Story
+    source_field = 'cover_image'
+    result_message = 'Обработано обложек'
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 05:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_alter_story_cover_image_alter_userprofile_avatar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='story',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='Хеш содержания'),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='content_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='HTML содержания'),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='render_version',
+            field=models.CharField(blank=True, editable=False, max_length=12, verbose_name='Версия рендера'),
+        ),
+    ]
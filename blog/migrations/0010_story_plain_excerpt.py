@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 05:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_story_rendered_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='story',
+            name='plain_excerpt',
+            field=models.TextField(blank=True, editable=False, verbose_name='Текстовое превью'),
+        ),
+    ]
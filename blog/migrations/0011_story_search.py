@@ -0,0 +1,55 @@
+# Generated by Django 5.2.7 on 2026-10-17 05:53
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """
+    PostgreSQL: GIN-индекс по search_vector и его заполнение.
+    SQLite: виртуальная таблица FTS5, связанная с blog_story по rowid.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "UPDATE blog_story SET search_vector = "
+            "setweight(to_tsvector('russian', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('russian', coalesce(excerpt, '')), 'B') || "
+            "setweight(to_tsvector('russian', coalesce(content, '')), 'C')"
+        )
+        schema_editor.execute(
+            'CREATE INDEX blog_story_search_vector_gin ON blog_story USING gin (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE blog_story_fts USING fts5("
+            "title, excerpt, content, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            'INSERT INTO blog_story_fts (rowid, title, excerpt, content) '
+            'SELECT id, title, excerpt, content FROM blog_story'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS blog_story_search_vector_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS blog_story_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_story_plain_excerpt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='story',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
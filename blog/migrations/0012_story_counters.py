@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-17 05:54
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    """
+    Заполняет счётчики лайков и одобренных комментариев по текущим данным.
+    """
+    Story = apps.get_model('blog', 'Story')
+    Like = apps.get_model('blog', 'Like')
+    Comment = apps.get_model('blog', 'Comment')
+
+    def count_of(queryset):
+        return Coalesce(
+            Subquery(
+                queryset.filter(story=OuterRef('pk')).order_by().values('story')
+                .annotate(total=Count('pk')).values('total'),
+                output_field=IntegerField(),
+            ),
+            0,
+        )
+
+    Story.objects.update(
+        like_count=count_of(Like.objects.all()),
+        active_comment_count=count_of(Comment.objects.filter(is_active=True)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_story_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='story',
+            name='active_comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Лайков'),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
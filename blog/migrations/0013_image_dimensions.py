@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:06
+
+import blog.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_story_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='story',
+            name='cover_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота обложки'),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='cover_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина обложки'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота аватара'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина аватара'),
+        ),
+        migrations.AlterField(
+            model_name='story',
+            name='cover_image',
+            field=models.ImageField(blank=True, help_text='Максимальный размер: 5 МБ. Форматы: JPG, PNG, WEBP', null=True, upload_to='story_covers/', validators=[blog.validators.validate_image_extension, blog.validators.FileSizeValidator(max_size_mb=5), blog.validators.validate_image_content], verbose_name='Обложка'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='avatar',
+            field=models.ImageField(blank=True, help_text='Максимальный размер: 2 МБ. Форматы: JPG, PNG, WEBP', null=True, upload_to='avatars/', validators=[blog.validators.validate_image_extension, blog.validators.FileSizeValidator(max_size_mb=2), blog.validators.validate_image_content], verbose_name='Аватар'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:12
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def populate_stats(apps, schema_editor):
+    """
+    Заполняет счётчики и статистику по дням по текущим данным.
+    """
+    Story = apps.get_model('blog', 'Story')
+    Comment = apps.get_model('blog', 'Comment')
+    Like = apps.get_model('blog', 'Like')
+    User = apps.get_model('auth', 'User')
+    StatCounter = apps.get_model('blog', 'StatCounter')
+    DailyStat = apps.get_model('blog', 'DailyStat')
+
+    now = timezone.now()
+    counters = {
+        'stories': Story.objects.filter(status='PB').count(),
+        'drafts': Story.objects.filter(status='DF').count(),
+        'comments': Comment.objects.filter(is_active=True).count(),
+        'users': User.objects.count(),
+        'total_likes': Like.objects.count(),
+    }
+    StatCounter.objects.bulk_create([StatCounter(name=name, value=value, updated_at=now) for name, value in counters.items()])
+
+    rows = []
+    for metric, model in (('stories', Story), ('comments', Comment), ('likes', Like)):
+        per_day = model.objects.annotate(day=TruncDate('created_at')).order_by().values_list('day').annotate(total=Count('pk'))
+        rows.extend(DailyStat(date=day, metric=metric, value=total) for day, total in per_day)
+    DailyStat.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('blog', '0013_image_dimensions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Название')),
+                ('value', models.BigIntegerField(default=0, verbose_name='Значение')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Счётчик',
+                'verbose_name_plural': 'Счётчики',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('metric', models.CharField(choices=[('stories', 'Рассказы'), ('comments', 'Комментарии'), ('likes', 'Лайки')], max_length=20, verbose_name='Показатель')),
+                ('value', models.IntegerField(default=0, verbose_name='Значение')),
+            ],
+            options={
+                'verbose_name': 'Статистика за день',
+                'verbose_name_plural': 'Статистика по дням',
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'metric'), name='unique_daily_stat')],
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
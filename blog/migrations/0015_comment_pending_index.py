@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0014_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_active', False)), fields=['-created_at', '-id'], name='comment_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0015_comment_pending_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='like',
+            name='story',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='likes', to='blog.story', verbose_name='Рассказ'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['story', '-created_at'], name='comment_story_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(condition=models.Q(('status', 'PB')), fields=['-published_at', '-id'], name='story_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(condition=models.Q(('status', 'PB')), fields=['category', '-published_at', '-id'], name='story_category_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(condition=models.Q(('status', 'PB')), fields=['author', '-published_at', '-id'], name='story_author_published_idx'),
+        ),
+    ]
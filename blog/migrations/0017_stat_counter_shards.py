@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:43
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def add_empty_shards(apps, schema_editor):
+    """
+    Создаёт пустые части для существующих счётчиков (COUNTER_SHARDS в blog.stats).
+    """
+    StatCounter = apps.get_model('blog', 'StatCounter')
+    now = timezone.now()
+    names = StatCounter.objects.values_list('name', flat=True)
+    StatCounter.objects.bulk_create(
+        [StatCounter(name=name, shard=shard, value=0, updated_at=now) for name in names for shard in range(1, 8)]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0016_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statcounter',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Часть'),
+        ),
+        migrations.AlterField(
+            model_name='statcounter',
+            name='name',
+            field=models.CharField(max_length=50, verbose_name='Название'),
+        ),
+        migrations.AddConstraint(
+            model_name='statcounter',
+            constraint=models.UniqueConstraint(fields=('name', 'shard'), name='unique_stat_counter_shard'),
+        ),
+        migrations.RunPython(add_empty_shards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0017_stat_counter_shards'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comment_pending_idx',
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='is_rejected',
+            field=models.BooleanField(default=False, verbose_name='Отклонён'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_active', False), ('is_rejected', False)), fields=['-created_at', '-id'], name='comment_pending_idx'),
+        ),
+    ]
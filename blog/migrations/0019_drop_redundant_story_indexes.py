@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:45
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0018_comment_rejected'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='story',
+            name='blog_story_publish_2eb771_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='story',
+            name='blog_story_author__3f00f6_idx',
+        ),
+    ]
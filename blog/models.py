@@ -1,23 +1,43 @@
-import re
+import warnings
+from django.conf import settings
 from django.utils.safestring import mark_safe
 from django.db import models
+from django.db.models import DEFERRED
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
 from django.urls import reverse
-from slugify import slugify
+from .slugs import unique_slug, SlugQuerySetMixin
 from django.utils import timezone
+from django.utils.functional import cached_property
 from imagekit.models import ImageSpecField
 from imagekit.processors import ResizeToFill
+from .imagegenerators import (
+    cover_variant, cover_variant_name, COVER_WIDTHS, COVER_FORMATS,
+    avatar_variant, avatar_variant_name, AVATAR_SIZES, ready_specs,
+)
 from markdownx.models import MarkdownxField
-from markdownx.utils import markdownify
-from django.utils.html import strip_tags
-from django.utils.text import Truncator
-from .validators import FileSizeValidator, validate_image_extension
+from .validators import FileSizeValidator, validate_image_extension, validate_image_content
+from .images import normalize_field_file, COVER_MAX_SIZE, AVATAR_MAX_SIZE
+from .rendering import render_markdown, content_digest, get_renderer_version, make_plain_excerpt, EXCERPT_WORDS
+
+
+def add_update_fields(save_kwargs, *fields):
+    """Дополняет update_fields полями, которые save() вычисляет сам"""
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None:
+        save_kwargs['update_fields'] = {*update_fields, *fields}
+
+
+class CategoryQuerySet(SlugQuerySetMixin, models.QuerySet):
+    slug_source_field = 'name'
 
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name='Название')
     slug = models.SlugField(max_length=100, unique=True, blank=True, verbose_name='Слаг', allow_unicode=True)
 
+    objects = CategoryQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Категория'
         verbose_name_plural = 'Категории'
@@ -28,7 +48,7 @@ class Category(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = unique_slug(Category, self.name)
         super().save(*args, **kwargs)
 
 
@@ -37,9 +57,14 @@ class UserProfile(models.Model):
     avatar = models.ImageField(upload_to='avatars/', 
                                blank=True, null=True, 
                                verbose_name='Аватар',
-                               validators=[validate_image_extension, FileSizeValidator(max_size_mb=2)], 
+                               validators=[validate_image_extension, FileSizeValidator(max_size_mb=2), validate_image_content], 
                                help_text='Максимальный размер: 2 МБ. Форматы: JPG, PNG, WEBP'
                                )
+    avatar_width = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name='Ширина аватара')
+    avatar_height = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name='Высота аватара')
+    avatar_32 = avatar_variant(32)
+    avatar_64 = avatar_variant(64)
+    avatar_128 = avatar_variant(128)
     bio = models.TextField(max_length=500, blank=True, verbose_name='О себе')
 
     class Meta:
@@ -49,12 +74,69 @@ class UserProfile(models.Model):
     def __str__(self):
         return f'Профиль {self.user.username}'
     
-    def get_avatar_url(self):
-        if self.avatar:
-            return self.avatar.url
-        return '/static/images/default-avatar.png'
+    def save(self, *args, **kwargs):
+        if 'avatar' not in self.get_deferred_fields() and self.avatar and not self.avatar._committed:
+            self.avatar_width, self.avatar_height = normalize_field_file(self.avatar, AVATAR_MAX_SIZE)
+            add_update_fields(kwargs, 'avatar_width', 'avatar_height')
+        super().save(*args, **kwargs)
+
+    IMAGE_SPEC_FIELDS = {'avatar': tuple(avatar_variant_name(size) for size in AVATAR_SIZES)}
+
+    def get_avatar_url(self, size=None):
+        """URL наименьшего варианта не меньше size пикселей; без size или крупнее — оригинал"""
+        if not self.avatar:
+            return '/static/images/default-avatar.png'
+        if size is not None:
+            # Вариант, который ещё не создан, заменяется следующим или оригиналом
+            for variant_size in AVATAR_SIZES:
+                name = avatar_variant_name(variant_size)
+                if variant_size >= int(size) and name in self.ready_avatar_variants:
+                    return getattr(self, name).url
+        return self.avatar.url
+
+    @cached_property
+    def ready_avatar_variants(self):
+        return ready_specs(self, self.IMAGE_SPEC_FIELDS['avatar'])
     
 
+class DeferredContentWarning(RuntimeWarning):
+    pass
+
+
+class DeferredContentError(Exception):
+    pass
+
+
+class StoryQuerySet(SlugQuerySetMixin, models.QuerySet):
+    slug_source_field = 'title'
+
+    # Поля, которые выводит карточка рассказа (blog/includes/story_card.html)
+    CARD_FIELDS = (
+        'title', 'slug', 'excerpt', 'plain_excerpt', 'cover_image',
+        'published_at', 'updated_at', 'like_count',
+        'author__username', 'author__profile__avatar',
+        'category__name', 'category__slug',
+    )
+
+    # Поля неограниченного размера, которые не нужны в списках
+    CONTENT_FIELDS = ('content', 'content_html', 'search_vector')
+
+    def published(self):
+        return self.filter(status=Story.Status.PUBLISHED)
+
+    def without_content(self):
+        return self.defer(*self.CONTENT_FIELDS)
+
+    def for_cards(self):
+        """Автор, его профиль и категория одним JOIN, без текста рассказа"""
+        return self.select_related('author__profile', 'category').only(*self.CARD_FIELDS)
+
+
+class PublishedStoryManager(models.Manager.from_queryset(StoryQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().published()
+
+
 class Story(models.Model):
     class Status(models.TextChoices):
         DRAFT = 'DF', 'Черновик'
@@ -69,40 +151,149 @@ class Story(models.Model):
     cover_image = models.ImageField(upload_to='story_covers/', 
                                     blank=True, null=True, 
                                     verbose_name='Обложка', 
-                                    validators=[validate_image_extension, FileSizeValidator(max_size_mb=5)], 
+                                    validators=[validate_image_extension, FileSizeValidator(max_size_mb=5), validate_image_content], 
                                     help_text='Максимальный размер: 5 МБ. Форматы: JPG, PNG, WEBP'
                                     )
+    cover_width = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name='Ширина обложки')
+    cover_height = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name='Высота обложки')
     cover_image_thumbnail = ImageSpecField(source='cover_image', processors=[ResizeToFill(800, 400)], format='JPEG', options={'quality': 75})
+    # Варианты для <picture>/srcset, имена строит cover_variant_name()
+    cover_avif_400 = cover_variant(400, 'avif')
+    cover_avif_800 = cover_variant(800, 'avif')
+    cover_avif_1600 = cover_variant(1600, 'avif')
+    cover_webp_400 = cover_variant(400, 'webp')
+    cover_webp_800 = cover_variant(800, 'webp')
+    cover_webp_1600 = cover_variant(1600, 'webp')
     status = models.CharField(max_length=2, choices=Status.choices, default=Status.DRAFT, verbose_name='Статус', db_index=True)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
     published_at = models.DateTimeField(blank=True, null=True, verbose_name='Опубликовано', db_index=True)
+    content_html = models.TextField(blank=True, editable=False, verbose_name='HTML содержания')
+    content_hash = models.CharField(max_length=64, blank=True, editable=False, verbose_name='Хеш содержания')
+    render_version = models.CharField(max_length=12, blank=True, editable=False, verbose_name='Версия рендера')
+    plain_excerpt = models.TextField(blank=True, editable=False, verbose_name='Текстовое превью')
+    like_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Лайков')
+    active_comment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев')
+    # Заполняется только на PostgreSQL, в SQLite используется таблица FTS5 (см. blog.search)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = StoryQuerySet.as_manager()
+    published = PublishedStoryManager()
 
     class Meta:
         verbose_name = 'Рассказ'
         verbose_name_plural = 'Рассказы'
         ordering = ['-published_at']
+        # Отдельные индексы (-published_at, status) и (author, status) не нужны:
+        # опубликованное читается по частичным индексам, черновики автора — по author_id
         indexes = [
-            models.Index(fields=['-published_at', 'status']),
-            models.Index(fields=['author', 'status']),
+            # Частичные индексы под списки опубликованного в порядке keyset-пагинации
+            models.Index(
+                fields=['-published_at', '-id'], condition=models.Q(status='PB'), name='story_published_idx'
+            ),
+            models.Index(
+                fields=['category', '-published_at', '-id'], condition=models.Q(status='PB'),
+                name='story_category_published_idx',
+            ),
+            models.Index(
+                fields=['author', '-published_at', '-id'], condition=models.Q(status='PB'),
+                name='story_author_published_idx',
+            ),
         ]
 
     def __str__(self):
         return self.title
     
+    RENDERED_FIELDS = ('content_html', 'content_hash', 'render_version', 'plain_excerpt')
+    IMAGE_SPEC_FIELDS = {'cover_image': ('cover_image_thumbnail', *(
+        cover_variant_name(suffix, width) for suffix in COVER_FORMATS for width in COVER_WIDTHS
+    ))}
+
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.title)
-        if self.status == self.Status.PUBLISHED:
-            if not self.published_at:
+        # Отложенные и не присвоенные поля не загружаются: то, что из них
+        # вычисляется, при таком сохранении не меняется
+        deferred = self.get_deferred_fields()
+        if 'slug' not in deferred and not self.slug:
+            self.slug = unique_slug(Story, self.title)
+        changed = False
+        if not {'content', 'content_hash', 'render_version'} & deferred:
+            changed = self.render_content()
+        # render_content() мог присвоить content_html
+        if not {'excerpt', 'content_html', 'plain_excerpt'} & self.get_deferred_fields():
+            changed = self.refresh_plain_excerpt() or changed
+        if changed:
+            add_update_fields(kwargs, *self.RENDERED_FIELDS)
+        if 'cover_image' not in deferred and self.cover_image and not self.cover_image._committed:
+            self.cover_width, self.cover_height = normalize_field_file(self.cover_image, COVER_MAX_SIZE)
+            add_update_fields(kwargs, 'cover_width', 'cover_height')
+
+        status_loaded = 'status' not in deferred
+        if status_loaded and self._original_status is DEFERRED and self.pk:
+            # Статус не загружался, но был присвоен: единственный случай, когда нужен запрос
+            self._original_status = Story.objects.filter(pk=self.pk).values_list('status', flat=True).first()
+        transition = status_loaded and self.status_changed
+        is_published = status_loaded and self.status == self.Status.PUBLISHED
+        if transition or (status_loaded and 'published_at' not in deferred):
+            if is_published and not self.published_at:
                 self.published_at = timezone.now()
-        else:
-            if self.pk:
-                old_story = Story.objects.filter(pk=self.pk).first()
-                if old_story and old_story.status == self.Status.PUBLISHED:
-                    self.published_at = None
+                add_update_fields(kwargs, 'published_at')
+            elif not is_published and self.was_published:
+                self.published_at = None
+                add_update_fields(kwargs, 'published_at')
         super().save(*args, **kwargs)
-        
+
+        from .signals import story_published, story_unpublished
+        if transition and is_published and not self.was_published:
+            story_published.send(sender=Story, instance=self)
+        elif transition and not is_published and self.was_published:
+            story_unpublished.send(sender=Story, instance=self)
+        self._original_status = self.__dict__.get('status', DEFERRED)
+
+    def prepare_for_bulk(self):
+        """Поля, которые обычно вычисляет save(); слаг назначает StoryQuerySet.bulk_create"""
+        self.render_content()
+        self.refresh_plain_excerpt()
+        if self.status != self.Status.PUBLISHED:
+            self.published_at = None
+        elif not self.published_at:
+            self.published_at = timezone.now()
+
+    # Статус на момент загрузки из БД: None — новый рассказ, DEFERRED — поле было отложено
+    _original_status = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._original_status = instance.__dict__.get('status', DEFERRED)
+        return instance
+
+    @property
+    def status_changed(self):
+        return self._original_status != self.status
+
+    @property
+    def was_published(self):
+        """Был ли рассказ опубликован до текущего (ещё не сохранённого) изменения"""
+        return self._original_status == self.Status.PUBLISHED
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Django вызывает refresh_from_db(fields=[...]) при обращении к отложенному
+        # полю: в списке это отдельный запрос на каждую строку
+        if fields and set(fields) & set(StoryQuerySet.CONTENT_FIELDS):
+            self._check_deferred_content(fields)
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'status' in fields:
+            self._original_status = self.__dict__.get('status', DEFERRED)
+
+    def _check_deferred_content(self, fields):
+        guard = settings.DEFERRED_CONTENT_GUARD or ('warn' if settings.DEBUG else 'off')
+        if guard == 'off':
+            return
+        message = f'Отложенные поля {", ".join(fields)} рассказа {self.pk} загружаются отдельным запросом'
+        if guard == 'raise':
+            raise DeferredContentError(message)
+        warnings.warn(message, DeferredContentWarning, stacklevel=4)
+
     def get_absolute_url(self):
         return reverse('blog:story_detail', kwargs={"slug": self.slug})
     
@@ -113,41 +304,59 @@ class Story(models.Model):
     
     def get_cover_thumbnail_url(self):
         if self.cover_image:
+            if 'cover_image_thumbnail' not in self.ready_cover_variants:
+                return self.cover_image.url
             return self.cover_image_thumbnail.url
         return '/static/images/default-cover.jpg'
     
-    def get_markdown_content(self):
-        if not self.content:
-            return ''
-        
-        html_pattern = re.compile(r'<[^>]+>')
-        is_html = bool(html_pattern.search(self.content))
+    def get_cover_sources(self):
+        """[(MIME-тип, srcset), ...] для <source> внутри <picture>; только созданные варианты"""
+        if not self.cover_image:
+            return []
+        sources = []
+        for suffix, (mime, *_) in COVER_FORMATS.items():
+            names = [(cover_variant_name(suffix, width), width) for width in COVER_WIDTHS]
+            srcset = ', '.join(
+                f'{getattr(self, name).url} {width}w' for name, width in names if name in self.ready_cover_variants
+            )
+            if srcset:
+                sources.append((mime, srcset))
+        return sources
 
-        if is_html:
-            return mark_safe(self.content)
-        html = markdownify(self.content)
-        return mark_safe(html)
-        
-    def get_plain_excerpt(self, words=25):
-        if self.excerpt:
-            text_source = self.excerpt
-        else:
-            text_source = self.content
-        
-        if not text_source:
-            return ''
+    @cached_property
+    def ready_cover_variants(self):
+        return ready_specs(self, self.IMAGE_SPEC_FIELDS['cover_image'])
+
+    def render_content(self, force=False):
+        """Обновляет сохранённый HTML, если изменилось содержание или настройки рендера"""
+        digest = content_digest(self.content)
+        version = get_renderer_version()
+        if not force and self.content_hash == digest and self.render_version == version:
+            return False
+        self.content_html = render_markdown(self.content)
+        self.content_hash = digest
+        self.render_version = version
+        return True
+
+    def get_markdown_content(self):
+        if self.content_html:
+            return mark_safe(self.content_html)
+        # Рассказ ещё не прошёл через render_stories
+        return mark_safe(render_markdown(self.content))
         
-        html_pattern = re.compile(r'<[^>]+>')
-        is_html = bool(html_pattern.search(text_source))
-
-        if is_html:
-            text = strip_tags(text_source)
-        else:
-            html_content = markdownify(text_source)
-            text = strip_tags(html_content)
+    def refresh_plain_excerpt(self):
+        plain_excerpt = make_plain_excerpt(self.excerpt, self.content_html)
+        if plain_excerpt == self.plain_excerpt:
+            return False
+        self.plain_excerpt = plain_excerpt
+        return True
         
-        text = ' '.join(text.split())
-        return Truncator(text).words(words, truncate='...')
+    def get_plain_excerpt(self, words=EXCERPT_WORDS):
+        if self.plain_excerpt and words == EXCERPT_WORDS:
+            return self.plain_excerpt
+        # Рассказ ещё не прошёл через render_stories или нужна другая длина
+        content_html = self.content_html or render_markdown(self.content)
+        return make_plain_excerpt(self.excerpt, content_html, words)
 
 
 class Comment(models.Model):
@@ -156,18 +365,34 @@ class Comment(models.Model):
     content = models.TextField(verbose_name='Комментарий')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
     is_active = models.BooleanField(default=False, verbose_name='Активен')
+    # Отклонённый модератором комментарий не удаляется и не возвращается в очередь
+    is_rejected = models.BooleanField(default=False, verbose_name='Отклонён')
 
     class Meta:
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ['-created_at']
+        indexes = [
+            # Очередь модерации: только непроверенные, в порядке keyset-пагинации
+            models.Index(
+                fields=['-created_at', '-id'], condition=models.Q(is_active=False, is_rejected=False),
+                name='comment_pending_idx',
+            ),
+            # Комментарии на странице рассказа
+            models.Index(
+                fields=['story', '-created_at'], condition=models.Q(is_active=True), name='comment_story_active_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'Комментарий от {self.author.username} к рассказу "{self.story.title}"'
 
 
 class Like(models.Model):
-    story = models.ForeignKey(Story, on_delete=models.CASCADE, related_name='likes', verbose_name='Рассказ')
+    # Отдельный индекс не нужен: поиск и подсчёт по рассказу идут по уникальному (story, user)
+    story = models.ForeignKey(
+        Story, on_delete=models.CASCADE, related_name='likes', verbose_name='Рассказ', db_index=False
+    )
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='liked_stories', verbose_name='Пользователь')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
 
@@ -177,4 +402,47 @@ class Like(models.Model):
         unique_together = ('story', 'user')
 
     def __str__(self):
-        return f'{self.user.username} лайкнул "{self.story.title}"'
\ No newline at end of file
+        return f'{self.user.username} лайкнул "{self.story.title}"'
+
+class StatCounter(models.Model):
+    """
+    Общие счётчики для панели администратора (см. blog.stats). Счётчик
+    разбит на несколько строк (частей), значение — их сумма.
+    """
+    name = models.CharField(max_length=50, verbose_name='Название')
+    shard = models.PositiveSmallIntegerField(default=0, verbose_name='Часть')
+    value = models.BigIntegerField(default=0, verbose_name='Значение')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
+
+    class Meta:
+        verbose_name = 'Счётчик'
+        verbose_name_plural = 'Счётчики'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'shard'], name='unique_stat_counter_shard'),
+        ]
+
+    def __str__(self):
+        return f'{self.name}[{self.shard}]: {self.value}'
+
+
+class DailyStat(models.Model):
+    """Число созданных за день рассказов, комментариев и лайков"""
+    class Metric(models.TextChoices):
+        STORIES = 'stories', 'Рассказы'
+        COMMENTS = 'comments', 'Комментарии'
+        LIKES = 'likes', 'Лайки'
+
+    date = models.DateField(verbose_name='Дата')
+    metric = models.CharField(max_length=20, choices=Metric.choices, verbose_name='Показатель')
+    value = models.IntegerField(default=0, verbose_name='Значение')
+
+    class Meta:
+        verbose_name = 'Статистика за день'
+        verbose_name_plural = 'Статистика по дням'
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'metric'], name='unique_daily_stat'),
+        ]
+
+    def __str__(self):
+        return f'{self.date} {self.metric}: {self.value}'
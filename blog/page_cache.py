@@ -0,0 +1,257 @@
+"""
+Кеш страниц с местами под пользовательские фрагменты.
+
+Страница рендерится один раз от имени анонимного пользователя, а вместо
+фрагментов, зависящих от посетителя (меню, сообщения, кнопка лайка, форма
+комментария), в неё попадают подписанные маркеры. Анонимам без сообщений
+отдаётся готовая страница целиком, остальным — каркас из кеша, в котором
+маркеры заменяются фрагментами, отрендеренными для текущего запроса.
+Декоратор работает и с асинхронными представлениями (blog.async_views).
+"""
+import hashlib
+import re
+from contextlib import contextmanager
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from urllib.parse import urlencode
+from django.contrib import messages
+from django.contrib.auth.models import AnonymousUser
+from django.core import signing
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.crypto import salted_hmac
+from django.utils.http import http_date, quote_etag
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+
+FRAGMENT_SALT = 'blog.page_cache.fragment'
+ETAG_SALT = 'blog.page_cache.etag'
+FRAGMENT_MARKER = '<!--user-fragment:{}-->'
+FRAGMENT_RE = re.compile(r'<!--user-fragment:([\w\-.:]+)-->')
+
+# Параметры, не влияющие на содержимое страницы
+IGNORED_QUERY_PARAMS = {'fbclid', 'gclid', 'yclid'}
+
+
+def is_skeleton_request(request):
+    return getattr(request, 'page_skeleton', False)
+
+
+def fragment_marker(template_name, values):
+    payload = signing.dumps({'t': template_name, 'v': values}, salt=FRAGMENT_SALT, compress=True)
+    return mark_safe(FRAGMENT_MARKER.format(payload))
+
+
+def fill_fragments(content, request):
+    def render_fragment(match):
+        try:
+            payload = signing.loads(match.group(1), salt=FRAGMENT_SALT)
+        except signing.BadSignature:
+            return ''
+        return render_to_string(payload['t'], payload['v'], request=request)
+
+    return FRAGMENT_RE.sub(render_fragment, content)
+
+
+def normalize_query(request):
+    params = sorted(
+        (key, value)
+        for key, values in request.GET.lists()
+        if key not in IGNORED_QUERY_PARAMS and not key.startswith('utm_')
+        for value in values
+        if value
+    )
+    return urlencode(params)
+
+
+def page_cache_key(key_prefix, request):
+    url = f'{request.path}?{normalize_query(request)}'
+    digest = hashlib.md5(url.encode('utf-8')).hexdigest()
+    return f'blog:page:{key_prefix}:{digest}'
+
+
+def has_pending_messages(request):
+    return len(messages.get_messages(request)) > 0
+
+
+@contextmanager
+def _skeleton_request(request):
+    # Подменяем пользователя у самого запроса, а не у копии: class-based views
+    # работают с self.request, сохранённым ещё до вызова dispatch()
+    user = request.user
+    request.user = AnonymousUser()
+    request.page_skeleton = True
+    try:
+        yield
+    finally:
+        request.user = user
+        request.page_skeleton = False
+
+
+def _skeleton_from(response):
+    if response.status_code != 200 or response.streaming:
+        return None
+    return {
+        'content': response.content.decode(response.charset),
+        'content_type': response['Content-Type'],
+    }
+
+
+def _render_skeleton(view_func, request, args, kwargs):
+    with _skeleton_request(request):
+        response = view_func(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+    return _skeleton_from(response)
+
+
+async def _arender_skeleton(view_func, request, args, kwargs):
+    with _skeleton_request(request):
+        response = await view_func(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            await sync_to_async(response.render)()
+    return _skeleton_from(response)
+
+
+def cache_page_for_anonymous(timeout, key_prefix_func):
+    """
+    Кеширует страницу, отрендеренную для анонимного посетителя. Префикс ключа
+    вычисляется для каждого запроса (см. blog.caching), поэтому записи
+    устаревают вместе с версией рассказа или списков.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            return _async_cache_page(view_func, timeout, key_prefix_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            key = page_cache_key(key_prefix_func(request, *args, **kwargs), request)
+            anonymous_key = f'{key}:anonymous'
+            personal = request.user.is_authenticated or has_pending_messages(request)
+
+            cached = cache.get_many([key, anonymous_key])
+            if not personal and anonymous_key in cached:
+                page = cached[anonymous_key]
+                return HttpResponse(page['content'], content_type=page['content_type'])
+
+            skeleton = cached.get(key)
+            if skeleton is None:
+                skeleton = _render_skeleton(view_func, request, args, kwargs)
+                if skeleton is None:
+                    return view_func(request, *args, **kwargs)
+                cache.set(key, skeleton, timeout)
+
+            content = fill_fragments(skeleton['content'], request)
+            # Страницу с CSRF-токеном нельзя отдавать другим посетителям
+            if not personal and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+                cache.set(anonymous_key, {'content': content, 'content_type': skeleton['content_type']}, timeout)
+            return HttpResponse(content, content_type=skeleton['content_type'])
+        return wrapper
+    return decorator
+
+
+def _async_cache_page(view_func, timeout, key_prefix_func):
+    """Та же логика, что в cache_page_for_anonymous, для async def представлений"""
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await view_func(request, *args, **kwargs)
+
+        key = page_cache_key(await sync_to_async(key_prefix_func)(request, *args, **kwargs), request)
+        anonymous_key = f'{key}:anonymous'
+        user = await request.auser()
+        personal = user.is_authenticated or await sync_to_async(has_pending_messages)(request)
+
+        cached = await cache.aget_many([key, anonymous_key])
+        if not personal and anonymous_key in cached:
+            page = cached[anonymous_key]
+            return HttpResponse(page['content'], content_type=page['content_type'])
+
+        skeleton = cached.get(key)
+        if skeleton is None:
+            skeleton = await _arender_skeleton(view_func, request, args, kwargs)
+            if skeleton is None:
+                return await view_func(request, *args, **kwargs)
+            await cache.aset(key, skeleton, timeout)
+
+        # Фрагменты обращаются к БД из шаблонных тегов, поэтому рендерятся в синхронном потоке
+        content = await sync_to_async(fill_fragments)(skeleton['content'], request)
+        if not personal and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+            await cache.aset(anonymous_key, {'content': content, 'content_type': skeleton['content_type']}, timeout)
+        return HttpResponse(content, content_type=skeleton['content_type'])
+    return wrapper
+
+
+def _session_tag(request):
+    """
+    Отпечаток сессии и секрета CSRF: после выхода, входа или смены токена
+    ETag меняется, и клиент не получит 304 на страницу с устаревшим токеном
+    """
+    session_key = request.session.session_key or ''
+    csrf_secret = request.META.get('CSRF_COOKIE', '')
+    return salted_hmac(ETAG_SALT, f'{session_key}:{csrf_secret}').hexdigest()[:16]
+
+
+def _validators(request, user, version):
+    if version is None:
+        return None, None
+    if not user.is_authenticated:
+        # Last-Modified не различает посетителей, поэтому только для анонимов:
+        # клиент без If-None-Match не должен получить 304 на чужую страницу
+        return quote_etag(f'{version}-0'), version // 10 ** 9
+    return quote_etag(f'{version}-{user.pk}-{_session_tag(request)}'), None
+
+
+def _set_validators(response, etag, last_modified):
+    if response.status_code not in (200, 304) or not etag:
+        return
+    # Для одного адреса ETag зависит от сессии в cookie
+    patch_vary_headers(response, ['Cookie'])
+    if response.status_code == 304:
+        return
+    response.headers.setdefault('ETag', etag)
+    if last_modified and not response.has_header('Last-Modified'):
+        response.headers['Last-Modified'] = http_date(last_modified)
+
+
+def conditional_page(version_func):
+    """
+    ETag и Last-Modified по версии из кеша (blog.caching): повторный запрос
+    с If-None-Match или If-Modified-Since получает 304 без рендера и без
+    запросов к БД. ETag учитывает пользователя, его сессию и секрет CSRF,
+    ответы помечаются Vary: Cookie; страницы с непоказанными
+    сообщениями не кешируются клиентом. Ставится снаружи cache_page_for_anonymous.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD') or await sync_to_async(has_pending_messages)(request):
+                    return await view_func(request, *args, **kwargs)
+                version = await sync_to_async(version_func)(request, *args, **kwargs)
+                etag, last_modified = _validators(request, await request.auser(), version)
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = await view_func(request, *args, **kwargs)
+                _set_validators(response, etag, last_modified)
+                return response
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or has_pending_messages(request):
+                return view_func(request, *args, **kwargs)
+            version = version_func(request, *args, **kwargs)
+            etag, last_modified = _validators(request, request.user, version)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+            _set_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
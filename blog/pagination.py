@@ -0,0 +1,195 @@
+"""
+Постраничный вывод по курсору (keyset).
+
+Вместо OFFSET страница выбирается условием «строки после/до последней
+показанной» по полям сортировки, поэтому стоимость страницы не зависит
+от её глубины, а общее число строк не считается на каждый запрос.
+"""
+import base64
+import json
+from django.core.cache import cache
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+
+COUNT_CACHE_TIMEOUT = 60 * 5
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class CursorPage:
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage ({len(self.object_list)} objects)>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    ordering — поля сортировки, последнее должно быть уникальным (обычно pk).
+    count_cache_key — ключ, под которым кешируется примерное общее число строк.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-published_at', '-pk'), count_cache_key=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.count_cache_key = count_cache_key
+        self._exact_count = None
+
+    def _fields(self):
+        return [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def _values(self, obj):
+        return [getattr(obj, name) for name, _ in self._fields()]
+
+    def encode_cursor(self, direction, obj):
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in self._values(obj)]
+        raw = json.dumps([direction, *values], separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, *values = json.loads(raw)
+            if direction not in ('n', 'p') or len(values) != len(self.ordering):
+                raise ValueError
+            opts = self.queryset.model._meta
+            values = [
+                (opts.pk if name == 'pk' else opts.get_field(name)).to_python(value)
+                for (name, _), value in zip(self._fields(), values)
+            ]
+        except Exception:
+            raise InvalidCursor('Неверный курсор страницы')
+        return direction, values
+
+    def _keyset_filter(self, values, forward):
+        """(a, b) после (x, y) при сортировке по убыванию: a < x OR (a = x AND b < y)"""
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self._fields(), values):
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _page_queryset(self, cursor):
+        """Запрос строк страницы (на одну больше, чтобы узнать о следующей) и направление от курсора"""
+        if not cursor:
+            return self.queryset.order_by(*self.ordering)[:self.per_page + 1], None
+        direction, values = self.decode_cursor(cursor)
+        forward = direction == 'n'
+        ordering = self.ordering if forward else [
+            name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering
+        ]
+        queryset = self.queryset.filter(self._keyset_filter(values, forward)).order_by(*ordering)
+        return queryset[:self.per_page + 1], forward
+
+    def _make_page(self, rows, forward):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if forward is None:
+            if not has_more:
+                self._exact_count = len(rows)
+            next_cursor = self.encode_cursor('n', rows[-1]) if has_more else None
+            return CursorPage(rows, self, next_cursor=next_cursor)
+
+        if not rows:
+            raise InvalidCursor('Страница пуста')
+        if forward:
+            next_cursor = self.encode_cursor('n', rows[-1]) if has_more else None
+            previous_cursor = self.encode_cursor('p', rows[0])
+        else:
+            rows.reverse()
+            next_cursor = self.encode_cursor('n', rows[-1])
+            previous_cursor = self.encode_cursor('p', rows[0]) if has_more else None
+        return CursorPage(rows, self, next_cursor=next_cursor, previous_cursor=previous_cursor)
+
+    def get_page(self, cursor=None):
+        queryset, forward = self._page_queryset(cursor)
+        return self._make_page(list(queryset), forward)
+
+    async def aget_page(self, cursor=None):
+        queryset, forward = self._page_queryset(cursor)
+        return self._make_page([obj async for obj in queryset], forward)
+
+    @cached_property
+    def count(self):
+        """Примерное число строк: точное на единственной странице, иначе из кеша"""
+        if self._exact_count is not None:
+            return self._exact_count
+        if self.count_cache_key is None:
+            return self.queryset.count()
+        count = cache.get(self.count_cache_key)
+        if count is None:
+            count = self.queryset.count()
+            cache.set(self.count_cache_key, count, COUNT_CACHE_TIMEOUT)
+        return count
+
+    async def acount(self):
+        """count для асинхронных представлений; значение запоминается, и шаблон читает его без запросов"""
+        if 'count' in self.__dict__:
+            return self.count
+        if self._exact_count is not None:
+            count = self._exact_count
+        elif self.count_cache_key is None:
+            count = await self.queryset.acount()
+        else:
+            count = await cache.aget(self.count_cache_key)
+            if count is None:
+                count = await self.queryset.acount()
+                await cache.aset(self.count_cache_key, count, COUNT_CACHE_TIMEOUT)
+        self.count = count
+        return count
+
+
+class KeysetPaginationMixin:
+    """Подменяет Paginator в ListView на KeysetPaginator"""
+    cursor_kwarg = 'cursor'
+    keyset_ordering = ('-published_at', '-pk')
+
+    def use_keyset_pagination(self):
+        return True
+
+    def get_count_cache_key(self):
+        return None
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_keyset_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(
+            queryset, page_size, self.keyset_ordering, count_cache_key=self.get_count_cache_key()
+        )
+        try:
+            page = paginator.get_page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return (paginator, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,63 @@
+"""Рендеринг содержимого рассказов в HTML"""
+import hashlib
+import json
+import re
+from django.conf import settings
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+from markdownx.utils import markdownify
+
+
+HTML_PATTERN = re.compile(r'<[^>]+>')
+
+# Увеличивать при изменении логики рендера, не связанной с настройками
+RENDERER_REVISION = 1
+
+
+def is_html(text):
+    return bool(HTML_PATTERN.search(text))
+
+
+def render_markdown(text):
+    """Превращает Markdown в HTML; готовый HTML возвращается как есть"""
+    if not text:
+        return ''
+    if is_html(text):
+        return text
+    return markdownify(text)
+
+
+def content_digest(text):
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+
+def get_renderer_version():
+    """Отпечаток настроек Markdown: меняется вместе с MARKDOWNX_MARKDOWN_EXTENSIONS"""
+    config = {
+        'revision': RENDERER_REVISION,
+        'extensions': getattr(settings, 'MARKDOWNX_MARKDOWN_EXTENSIONS', []),
+        'configs': getattr(settings, 'MARKDOWNX_MARKDOWN_EXTENSION_CONFIGS', {}),
+        'markdownify': getattr(settings, 'MARKDOWNX_MARKDOWNIFY_FUNCTION', ''),
+    }
+    raw = json.dumps(config, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()[:12]
+
+
+EXCERPT_WORDS = 25
+# Для превью хватает начала текста: не разбираем весь HTML длинного рассказа
+EXCERPT_SOURCE_CHARS = 4000
+
+
+def make_plain_excerpt(excerpt, content_html, words=EXCERPT_WORDS):
+    """Короткое текстовое превью из описания или начала отрендеренного содержания"""
+    if excerpt:
+        source = render_markdown(excerpt)
+    else:
+        source = content_html[:EXCERPT_SOURCE_CHARS]
+        # Отрезаем тег, оборванный на границе
+        tag_start = source.rfind('<')
+        if tag_start > source.rfind('>'):
+            source = source[:tag_start]
+
+    text = ' '.join(strip_tags(source).split())
+    return Truncator(text).words(words, truncate='...')
@@ -0,0 +1,113 @@
+"""Полнотекстовый поиск по рассказам: tsvector + GIN на PostgreSQL, FTS5 на SQLite"""
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections, router
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'blog_story_fts'
+INDEXED_FIELDS = {'title', 'excerpt', 'content'}
+
+# Веса полей: заголовок важнее описания, описание важнее текста
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+
+
+def _vendor(model):
+    return connections[router.db_for_write(model)].vendor
+
+
+def build_search_vector():
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('excerpt', weight='B', config=SEARCH_CONFIG)
+        + SearchVector('content', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def fts_match_expression(query):
+    """Превращает пользовательский ввод в безопасный запрос FTS5 (все слова, поиск по префиксу)"""
+    terms = []
+    for term in query.split():
+        term = term.replace('"', '')
+        if term:
+            terms.append(f'"{term}"*')
+    return ' '.join(terms)
+
+
+def index_stories(model, pks):
+    """Пересчитывает поисковый индекс для рассказов с указанными pk"""
+    pks = list(pks)
+    if not pks:
+        return
+    vendor = _vendor(model)
+    if vendor == 'postgresql':
+        model.objects.filter(pk__in=pks).update(search_vector=build_search_vector())
+    elif vendor == 'sqlite':
+        table = model._meta.db_table
+        placeholders = ', '.join(['%s'] * len(pks))
+        with connections[router.db_for_write(model)].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', pks)
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, excerpt, content) '
+                f'SELECT id, title, excerpt, content FROM {table} WHERE id IN ({placeholders})',
+                pks,
+            )
+
+
+def remove_stories(model, pks):
+    pks = list(pks)
+    if not pks or _vendor(model) != 'sqlite':
+        # В PostgreSQL вектор хранится в самой строке и удаляется вместе с ней
+        return
+    placeholders = ', '.join(['%s'] * len(pks))
+    with connections[router.db_for_write(model)].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', pks)
+
+
+def search_stories(queryset, query):
+    """Фильтрует queryset по запросу и сортирует по релевантности"""
+    query = query.strip()
+    vendor = connections[queryset.db].vendor
+    # Как и до полнотекстового поиска, по части имени автора
+    author_match = Q(author__username__icontains=query)
+
+    if vendor == 'postgresql':
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        queryset = queryset.filter(Q(search_vector=search_query) | author_match).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        )
+    elif vendor == 'sqlite':
+        match = fts_match_expression(query)
+        if not match:
+            return queryset.none()
+        return _search_sqlite(queryset, match, author_match)
+    else:
+        return queryset.filter(
+            Q(title__icontains=query) | Q(content__icontains=query) | author_match
+        ).order_by('-published_at', '-pk')
+
+    return queryset.order_by(F('rank').desc(nulls_last=True), '-published_at', '-pk')
+
+
+def _search_sqlite(queryset, match, author_match):
+    """
+    Совпадения FTS5 присоединяются к рассказам одним запросом MATCH, и bm25()
+    считается в том же проходе. Условие MATCH нельзя объединить через OR
+    с условием по автору, поэтому рассказы автора без совпадений по тексту
+    добавляются через UNION ALL с пустым rank.
+    """
+    table = queryset.model._meta.db_table
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    # Сортировка внутри частей UNION не допускается
+    queryset = queryset.order_by()
+    # bm25() тем меньше, чем документ релевантнее, поэтому меняем знак
+    hits = queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+    ).annotate(rank=RawSQL(f'-bm25({FTS_TABLE}, {weights})', ()))
+    by_author = queryset.filter(author_match).exclude(
+        pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,))
+    ).annotate(rank=Value(None, output_field=FloatField()))
+    return hits.union(by_author, all=True).order_by(F('rank').desc(nulls_last=True), '-published_at', '-pk')
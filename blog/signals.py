@@ -1,11 +1,194 @@
-from django.db.models.signals import post_save
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.contrib.auth.models import User
-from django.dispatch import receiver
-from .models import UserProfile
+from django.dispatch import receiver, Signal
+from .models import UserProfile, Story, Category, Comment, Like, DailyStat
+from . import search, caching, sitemaps
+from .tasks import run_in_background
+from .stats import change_counters, change_daily, story_counter
+from .counters import change_like_count, change_comment_counts
+
+
+# Смена статуса рассказа (Story.save): аргумент instance
+story_published = Signal()
+story_unpublished = Signal()
 
 
 @receiver(post_save, sender=User)
 def create_or_update_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
-    
\ No newline at end of file
+
+
+@receiver(post_save, sender=Story)
+def update_story_search_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not search.INDEXED_FIELDS & set(update_fields):
+        return
+    search.index_stories(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=Story)
+def remove_story_from_search_index(sender, instance, **kwargs):
+    search.remove_stories(sender, [instance.pk])
+
+
+@receiver(post_save, sender=Story)
+def invalidate_story_caches(sender, instance, raw=False, **kwargs):
+    # Отложенные поля не загружаются: слаг и статус при таком сохранении не менялись
+    deferred = instance.get_deferred_fields()
+    if 'slug' not in deferred:
+        caching.remember_story_slug(instance.slug, instance.pk)
+    caching.bump_story_version(instance.pk)
+    # Черновики в списки не попадают; post_save приходит до сброса was_published.
+    # Про рассказ с отложенным статусом неизвестно, в списках ли он, поэтому списки сбрасываются
+    if 'status' in deferred or instance.status == Story.Status.PUBLISHED or instance.was_published:
+        caching.bump_listing_generation()
+        caching.bump_feed_generation()
+        # Публикация, снятие, новый слаг или lastmod: части карты сайта пересобираются в фоне.
+        # Отложенные автор и категория не загружаются, их найдёт update_for_story
+        if not raw:
+            fields = instance.__dict__
+            run_in_background(sitemaps.update_for_story, instance.pk, fields.get('author_id'), fields.get('category_id'))
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_stories(sender, instance, **kwargs):
+    # После удаления у рассказов уже не будет ссылки на категорию (SET_NULL)
+    instance.story_pks = list(instance.stories.values_list('pk', flat=True))
+
+
+# Категория и профиль (аватар, описание) выводятся в списках, в карточках
+# и на страницах рассказов: автора и тех, что пользователь комментировал
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=UserProfile)
+def invalidate_listing_caches(sender, instance, **kwargs):
+    caching.bump_listing_generation()
+    if sender is Category:
+        caching.bump_feed_generation()
+        story_pks = getattr(instance, 'story_pks', None)
+        if story_pks is None:
+            story_pks = instance.stories.values_list('pk', flat=True)
+    else:
+        story_pks = Story.objects.filter(
+            Q(author_id=instance.user_id) | Q(comments__author_id=instance.user_id, comments__is_active=True)
+        ).values_list('pk', flat=True).distinct()
+    caching.bump_story_versions(list(story_pks))
+
+
+@receiver(post_delete, sender=Story)
+def invalidate_deleted_story_caches(sender, instance, **kwargs):
+    caching.forget_story_slug(instance.slug)
+    caching.bump_story_version(instance.pk)
+    caching.bump_listing_generation()
+    caching.bump_feed_generation()
+
+
+# Удаление лайков и комментариев (в т.ч. каскадное) уменьшает счётчики рассказа
+@receiver(post_delete, sender=Like)
+def decrement_like_count(sender, instance, **kwargs):
+    change_like_count(instance.story_id, -1)
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comment_count(sender, instance, **kwargs):
+    if instance.is_active:
+        change_comment_counts({instance.story_id: -1})
+
+
+# Очередь модерации: новый неодобренный комментарий, правка или удаление
+# из очереди меняют число, которое страница модерации держит в кеше
+@receiver(post_save, sender=Comment)
+def forget_moderation_count_on_save(sender, instance, created, **kwargs):
+    if not (created and instance.is_active):
+        caching.forget_moderation_count()
+
+
+@receiver(post_delete, sender=Comment)
+def forget_moderation_count_on_delete(sender, instance, **kwargs):
+    if not instance.is_active and not instance.is_rejected:
+        caching.forget_moderation_count()
+
+
+# Статистика панели администратора (blog.stats); лайки и одобренные
+# комментарии учитываются в blog.counters вместе со счётчиками рассказов
+@receiver(post_save, sender=User)
+def count_created_user(sender, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counters({'users': 1})
+
+
+@receiver(post_delete, sender=User)
+def count_deleted_user(sender, **kwargs):
+    change_counters({'users': -1})
+
+
+@receiver(post_save, sender=Story)
+def count_saved_story(sender, instance, created, raw=False, **kwargs):
+    if raw or (not created and 'status' in instance.get_deferred_fields()):
+        # Статус отложен и не присвоен, значит, не менялся
+        return
+    after = story_counter(instance.status)
+    if created:
+        change_counters({after: 1})
+        change_daily(DailyStat.Metric.STORIES, instance.created_at, 1)
+    else:
+        before = story_counter(Story.Status.PUBLISHED if instance.was_published else Story.Status.DRAFT)
+        if before != after:
+            change_counters({before: -1, after: 1})
+
+
+@receiver(post_delete, sender=Story)
+def count_deleted_story(sender, instance, **kwargs):
+    change_counters({story_counter(instance.status): -1})
+    change_daily(DailyStat.Metric.STORIES, instance.created_at, -1)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Like)
+def count_created_reaction(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        metric = DailyStat.Metric.COMMENTS if sender is Comment else DailyStat.Metric.LIKES
+        change_daily(metric, instance.created_at, 1)
+
+
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Like)
+def count_deleted_reaction(sender, instance, **kwargs):
+    metric = DailyStat.Metric.COMMENTS if sender is Comment else DailyStat.Metric.LIKES
+    change_daily(metric, instance.created_at, -1)
+
+
+# Карта сайта: при сохранении рассказа части пересобирает invalidate_story_caches
+@receiver(post_delete, sender=Story)
+def update_sitemaps_on_delete(sender, instance, **kwargs):
+    if instance.status == Story.Status.PUBLISHED:
+        run_in_background(sitemaps.update_for_story, instance.pk, instance.author_id, instance.category_id)
+
+
+# Адреса категорий и авторов строятся из слага и логина: раздел карты сайта и поле
+SITEMAP_URL_FIELDS = {Category: ('categories', 'slug'), User: ('authors', 'username')}
+
+
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=User)
+def remember_sitemap_url_field(sender, instance, update_fields=None, raw=False, **kwargs):
+    # Вход пользователя сохраняет только last_login: запрос не нужен
+    _, field = SITEMAP_URL_FIELDS[sender]
+    if raw or instance.pk is None or (update_fields is not None and field not in update_fields):
+        return
+    instance.sitemap_url_value = sender._default_manager.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=User)
+def update_sitemaps_on_rename(sender, instance, **kwargs):
+    section, field = SITEMAP_URL_FIELDS[sender]
+    previous = instance.__dict__.pop('sitemap_url_value', None)
+    if previous is not None and previous != getattr(instance, field):
+        run_in_background(sitemaps.update_shards, {section: [instance.pk]})
+
+
+@receiver(post_delete, sender=Category)
+def update_sitemaps_on_category_delete(sender, instance, **kwargs):
+    run_in_background(sitemaps.update_shards, {'categories': [instance.pk]})
@@ -0,0 +1,307 @@
+"""
+Карта сайта из заранее построенных файлов.
+
+Рассказы, категории и авторы разбиты на части по pk // SHARD_SIZE, поэтому
+в каждом файле не больше 50 000 адресов, а публикация рассказа пересобирает
+только части, где он, его автор и категория. Строки читаются через
+.iterator() и пишутся во временный файл, так что память не зависит от
+размера архива. Файлы лежат в default_storage (файловое хранилище) и отдаются
+как есть; индекс собирается по списку файлов, lastmod части — время
+изменения файла. Полная сборка — команда build_sitemaps.
+
+Готовый файл заменяет старый через os.replace, поэтому читатель никогда не
+видит недописанный или удалённый файл. Пересборка частей вместе с индексом
+идёт под блокировкой в общем кеше: воркеры разных процессов не перезаписывают
+файлы друг друга, а индекс не ссылается на часть, которую удаляет соседний
+процесс. Фоновый воркер не ждёт блокировку: он отмечает части в кеше, и их
+пересобирает тот, кто блокировку держит.
+"""
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timezone
+from xml.sax.saxutils import escape
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import Max, Q
+from django.http import FileResponse, Http404
+from django.urls import reverse
+from django.views.decorators.http import last_modified
+from .models import Story, Category
+
+
+SHARD_SIZE = 50000
+CHUNK_SIZE = 2000
+# Часть размером до 10 МБ остаётся в памяти, больше — уходит во временный файл
+SPOOL_SIZE = 10 * 1024 * 1024
+SITEMAP_DIR = 'sitemaps'
+INDEX_NAME = f'{SITEMAP_DIR}/sitemap.xml'
+SHARD_RE = re.compile(r'^(stories|categories|authors)-(\d+)\.xml$')
+XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+LOCK_KEY = 'blog:sitemaps:lock'
+DIRTY_KEY_PREFIX = 'blog:sitemaps:dirty'
+# Дольше полной сборки; блокировка упавшего процесса снимается сама
+LOCK_TIMEOUT = 60 * 30
+LOCK_POLL_INTERVAL = 0.5
+
+PUBLISHED = Q(stories__status=Story.Status.PUBLISHED)
+
+
+def _story_entries(lower, upper):
+    stories = (
+        Story.published.filter(pk__gte=lower, pk__lt=upper)
+        .order_by('pk')
+        .values_list('slug', 'updated_at')
+    )
+    for slug, updated_at in stories.iterator(chunk_size=CHUNK_SIZE):
+        yield reverse('blog:story_detail', args=[slug]), updated_at
+
+
+def _category_entries(lower, upper):
+    categories = (
+        Category.objects.filter(pk__gte=lower, pk__lt=upper)
+        .annotate(lastmod=Max('stories__updated_at', filter=PUBLISHED))
+        .filter(lastmod__isnull=False)
+        .order_by('pk')
+        .values_list('slug', 'lastmod')
+    )
+    for slug, lastmod in categories.iterator(chunk_size=CHUNK_SIZE):
+        yield reverse('blog:category_stories', args=[slug]), lastmod
+
+
+def _author_entries(lower, upper):
+    authors = (
+        User.objects.filter(pk__gte=lower, pk__lt=upper)
+        .annotate(lastmod=Max('stories__updated_at', filter=PUBLISHED))
+        .filter(lastmod__isnull=False)
+        .order_by('pk')
+        .values_list('username', 'lastmod')
+    )
+    for username, lastmod in authors.iterator(chunk_size=CHUNK_SIZE):
+        yield reverse('blog:user_stories', args=[username]), lastmod
+
+
+# Раздел -> (модель, по pk которой делятся части; адреса и lastmod части)
+SECTIONS = {
+    'stories': (Story, _story_entries),
+    'categories': (Category, _category_entries),
+    'authors': (User, _author_entries),
+}
+
+
+def absolute_url(path):
+    return settings.SITE_BASE_URL.rstrip('/') + path
+
+
+def shard_of(pk):
+    return pk // SHARD_SIZE
+
+
+def shard_name(section, number):
+    return f'{SITEMAP_DIR}/{section}-{number}.xml'
+
+
+@contextmanager
+def rebuild_lock(timeout=LOCK_TIMEOUT, blocking=True):
+    """
+    Одна пересборка карты сайта на все процессы (cache.add атомарен в Redis).
+    С blocking=False блокировка пробуется один раз; значение контекста — получена ли она.
+    """
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + timeout
+    while not cache.add(LOCK_KEY, token, LOCK_TIMEOUT):
+        if not blocking:
+            yield False
+            return
+        if time.monotonic() >= deadline:
+            raise TimeoutError('Карту сайта пересобирает другой процесс')
+        time.sleep(LOCK_POLL_INTERVAL)
+    try:
+        yield True
+    finally:
+        if cache.get(LOCK_KEY) == token:
+            cache.delete(LOCK_KEY)
+
+
+def _save(name, file):
+    """Пишет файл рядом под временным именем и атомарно подменяет им старый"""
+    path = default_storage.path(name)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    file.seek(0)
+    # Временное имя начинается с точки и не попадает под SHARD_RE
+    with tempfile.NamedTemporaryFile(dir=directory, prefix='.', suffix='.tmp', delete=False) as temp:
+        shutil.copyfileobj(file, temp)
+    try:
+        os.chmod(temp.name, default_storage.file_permissions_mode or 0o644)
+        os.replace(temp.name, path)
+    except BaseException:
+        os.unlink(temp.name)
+        raise
+
+
+def write_shard(section, number):
+    """
+    Пересобирает одну часть раздела; пустая часть удаляется. Возвращает число
+    адресов. Вызывается под rebuild_lock().
+    """
+    _, entries = SECTIONS[section]
+    name = shard_name(section, number)
+    count = 0
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as file:
+        file.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{XMLNS}">\n'.encode())
+        for path, lastmod in entries(number * SHARD_SIZE, (number + 1) * SHARD_SIZE):
+            file.write(
+                f'<url><loc>{escape(absolute_url(path))}</loc><lastmod>{lastmod.isoformat()}</lastmod></url>\n'.encode()
+            )
+            count += 1
+        file.write(b'</urlset>\n')
+        if count:
+            _save(name, file)
+        else:
+            default_storage.delete(name)
+    return count
+
+
+def _shard_files():
+    if not default_storage.exists(SITEMAP_DIR):
+        return []
+    _, files = default_storage.listdir(SITEMAP_DIR)
+    shards = [(match.group(1), int(match.group(2)), name) for name in files if (match := SHARD_RE.match(name))]
+    return sorted(shards)
+
+
+def write_index():
+    """Индекс по частям, которые есть на диске. Вызывается под rebuild_lock()"""
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as file:
+        file.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{XMLNS}">\n'.encode())
+        for section, number, name in _shard_files():
+            location = absolute_url(reverse('blog:sitemap_shard', args=[section, number]))
+            try:
+                modified = default_storage.get_modified_time(f'{SITEMAP_DIR}/{name}')
+            except FileNotFoundError:
+                # Часть удалили после чтения списка файлов
+                continue
+            file.write(
+                f'<sitemap><loc>{escape(location)}</loc><lastmod>{modified.isoformat()}</lastmod></sitemap>\n'.encode()
+            )
+        file.write(b'</sitemapindex>\n')
+        _save(INDEX_NAME, file)
+
+
+def _dirty_key(section, number):
+    return f'{DIRTY_KEY_PREFIX}:{section}:{number}'
+
+
+def _mark_shards(pks):
+    """Отмечает части, где лежат объекты {раздел: [pk, ...]}; отметка живёт до пересборки"""
+    keys = {_dirty_key(section, shard_of(pk)) for section, section_pks in pks.items() for pk in section_pks if pk is not None}
+    cache.set_many(dict.fromkeys(keys, True), None)
+
+
+def _dirty_shards():
+    """Отмеченные части среди существующих файлов и частей до наибольшего pk раздела"""
+    shards = {(section, number) for section, number, _ in _shard_files()}
+    for section, (model, _) in SECTIONS.items():
+        last_pk = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        shards.update((section, number) for number in range(shard_of(last_pk) + 1))
+    keys = {_dirty_key(*shard): shard for shard in shards}
+    return {keys[key] for key in cache.get_many(list(keys))}
+
+
+def _rebuild_dirty():
+    """
+    Пересобирает отмеченные части, пока появляются новые отметки, затем индекс.
+    Отметка снимается до пересборки, поэтому изменение, отмеченное во время
+    записи части, не теряется. Вызывается под rebuild_lock().
+    """
+    while shards := _dirty_shards():
+        cache.delete_many([_dirty_key(*shard) for shard in shards])
+        for section, number in sorted(shards):
+            write_shard(section, number)
+    write_index()
+
+
+def rebuild_marked():
+    """
+    Пересобирает отмеченные части, если блокировка свободна; иначе их пересоберёт
+    её владелец. После снятия блокировки отметки проверяются снова: отмеченное
+    между последней проверкой владельца и снятием иначе осталось бы без пересборки.
+    """
+    while _dirty_shards():
+        with rebuild_lock(blocking=False) as acquired:
+            if not acquired:
+                return
+            _rebuild_dirty()
+
+
+def build_sitemaps():
+    """Полная сборка: все части всех разделов, лишние файлы удаляются. Возвращает {раздел: адресов}"""
+    totals = {}
+    with rebuild_lock():
+        # Отмеченное до начала сборки она и так пересоберёт
+        cache.delete_many([_dirty_key(*shard) for shard in _dirty_shards()])
+        for section, (model, _) in SECTIONS.items():
+            last_pk = model.objects.aggregate(last=Max('pk'))['last'] or 0
+            numbers = range(shard_of(last_pk) + 1)
+            totals[section] = sum(write_shard(section, number) for number in numbers)
+            for stale_section, number, name in _shard_files():
+                if stale_section == section and number not in numbers:
+                    default_storage.delete(f'{SITEMAP_DIR}/{name}')
+        _rebuild_dirty()
+    rebuild_marked()
+    return totals
+
+
+def update_shards(pks):
+    """
+    Пересобирает части, где лежат объекты {раздел: [pk, ...]}, и индекс. Воркер
+    фонового пула не ждёт блокировку: если её держит другой процесс, он
+    пересоберёт отмеченные части сам.
+    """
+    _mark_shards(pks)
+    rebuild_marked()
+
+
+def update_for_story(story_pk, author_pk=None, category_pk=None):
+    """
+    Пересобирает части с рассказом, его автором и категорией (после сохранения
+    или удаления). Без автора оба pk читаются из БД: поля были отложены.
+    """
+    if author_pk is None:
+        author_pk, category_pk = Story.objects.filter(pk=story_pk).values_list('author_id', 'category_id').first() or (None, None)
+    update_shards({'stories': [story_pk], 'authors': [author_pk], 'categories': [category_pk]})
+
+
+def _modified(name):
+    try:
+        return default_storage.get_modified_time(name).astimezone(timezone.utc)
+    except OSError:
+        return None
+
+
+def _serve(name):
+    try:
+        file = default_storage.open(name)
+    except FileNotFoundError:
+        raise Http404('Карта сайта ещё не построена')
+    return FileResponse(file, content_type='application/xml; charset=utf-8')
+
+
+@last_modified(lambda request: _modified(INDEX_NAME))
+def sitemap_index(request):
+    return _serve(INDEX_NAME)
+
+
+@last_modified(lambda request, section, number: _modified(shard_name(section, number)))
+def sitemap_shard(request, section, number):
+    if section not in SECTIONS:
+        raise Http404('Нет такого раздела карты сайта')
+    return _serve(shard_name(section, number))
@@ -0,0 +1,87 @@
+"""
+Выделение уникальных слагов.
+
+Занятые варианты (slug, slug-2, slug-3, ...) для всей пачки значений
+выбираются одним запросом по префиксу (LIKE 'slug-%' по индексу поля),
+следующий номер вычисляется в Python. У длинной основы вариант с суффиксом
+обрезан до длины поля, поэтому для неё ищется общее начало всех вариантов,
+а номер занятого слага сверяется с вариантом, который дала бы основа.
+Повторы внутри пачки тоже учитываются, поэтому слаги можно назначать
+объектам перед bulk_create.
+"""
+import re
+from django.db.models import Q
+from slugify import slugify
+
+
+# Суффикс -N не длиннее этого; длинная основа обрезается под него
+MAX_SUFFIX_LENGTH = 11
+
+
+def _candidate(base, number, max_length):
+    """Вариант слага с номером: суффикс не должен выходить за max_length поля"""
+    if number == 1:
+        return base
+    suffix = f'-{number}'
+    return base[:max_length - len(suffix)].rstrip('-') + suffix
+
+
+def unique_slugs(model, values, field='slug'):
+    """Уникальные слаги для списка строк, в том же порядке"""
+    max_length = model._meta.get_field(field).max_length
+    fallback = model._meta.model_name
+    bases = [slugify(value or '')[:max_length].strip('-') or fallback for value in values]
+    if not bases:
+        return []
+
+    # Варианты длинной основы обрезаны, поэтому ищутся по общему началу всех вариантов
+    prefixes = Q()
+    for base in set(bases):
+        stem = base[:max_length - MAX_SUFFIX_LENGTH]
+        prefix = f'{base}-' if stem == base else stem.rstrip('-')
+        prefixes |= Q(**{field: base}) | Q(**{f'{field}__startswith': prefix})
+    taken = set(model._default_manager.filter(prefixes).values_list(field, flat=True))
+
+    # Наибольший занятый номер для каждой основы: 1 — сама основа без суффикса
+    numbered = [(slug, int(match.group(1))) for slug in taken if (match := re.search(r'-(\d+)$', slug))]
+    last_numbers = {}
+    for base in set(bases):
+        numbers = [number for slug, number in numbered if _candidate(base, number, max_length) == slug]
+        last_numbers[base] = max(numbers, default=1 if base in taken else 0)
+
+    slugs = []
+    for base in bases:
+        # Обрезанный вариант может совпасть с вариантом другой основы пачки
+        number = last_numbers[base] + 1
+        while _candidate(base, number, max_length) in taken:
+            number += 1
+        last_numbers[base] = number
+        slug = _candidate(base, number, max_length)
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def unique_slug(model, value, field='slug'):
+    return unique_slugs(model, [value], field)[0]
+
+
+def assign_slugs(instances, source_field, field='slug'):
+    """Назначает слаги объектам, у которых их ещё нет"""
+    pending = [instance for instance in instances if not getattr(instance, field)]
+    if not pending:
+        return
+    model = type(pending[0])
+    slugs = unique_slugs(model, [getattr(instance, source_field) for instance in pending], field)
+    for instance, slug in zip(pending, slugs):
+        setattr(instance, field, slug)
+
+
+class SlugQuerySetMixin:
+    """bulk_create назначает слаги всей пачке одним запросом"""
+    slug_source_field = None
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        assign_slugs(objs, self.slug_source_field)
+        return super().bulk_create(objs, *args, **kwargs)
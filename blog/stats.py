@@ -0,0 +1,138 @@
+"""
+Статистика для панели администратора.
+
+Общие счётчики (рассказы, черновики, одобренные комментарии, пользователи,
+лайки) и число новых записей по дням хранятся в таблицах StatCounter
+и DailyStat и меняются на ±1 вместе с данными (blog.signals, blog.counters),
+поэтому панель не выполняет COUNT(*) по большим таблицам. Массовые операции
+в обход сигналов исправляет команда reconcile_stats.
+
+Каждый счётчик хранится в COUNTER_SHARDS строках: изменение прибавляется
+к случайной из них, а значение — сумма при чтении. Иначе все лайки,
+комментарии и публикации ждали бы блокировку одной строки до конца своих
+транзакций.
+"""
+import random
+from datetime import datetime, timedelta
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Story, Comment, Like, StatCounter, DailyStat
+
+
+DASHBOARD_CACHE_KEY = 'blog:stats:dashboard'
+DASHBOARD_TIMEOUT = 60
+DASHBOARD_DAYS = 14
+COUNTER_SHARDS = 8
+
+# Счётчик -> запрос для точного пересчёта
+COUNTERS = {
+    'stories': lambda: Story.objects.filter(status=Story.Status.PUBLISHED),
+    'drafts': lambda: Story.objects.filter(status=Story.Status.DRAFT),
+    'comments': lambda: Comment.objects.filter(is_active=True),
+    'users': lambda: User.objects.all(),
+    'total_likes': lambda: Like.objects.all(),
+}
+
+DAILY_SOURCES = {
+    DailyStat.Metric.STORIES: Story,
+    DailyStat.Metric.COMMENTS: Comment,
+    DailyStat.Metric.LIKES: Like,
+}
+
+
+def story_counter(status):
+    return 'stories' if status == Story.Status.PUBLISHED else 'drafts'
+
+
+def change_counters(deltas):
+    """Применяет изменения вида {имя счётчика: delta}"""
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        shard = random.randrange(COUNTER_SHARDS)
+        if not StatCounter.objects.filter(name=name, shard=shard).update(value=F('value') + delta, updated_at=timezone.now()):
+            # Строк ещё нет: значение считается заново уже с учётом изменения
+            reconcile_counters([name])
+
+
+def local_day(value):
+    if isinstance(value, datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value
+
+
+def change_daily(metric, created_at, delta):
+    """created_at — момент создания записи или сразу дата"""
+    day = local_day(created_at)
+    if DailyStat.objects.filter(date=day, metric=metric).update(value=F('value') + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            DailyStat.objects.create(date=day, metric=metric, value=delta)
+    except IntegrityError:
+        DailyStat.objects.filter(date=day, metric=metric).update(value=F('value') + delta)
+
+
+def reconcile_counters(names=None):
+    """Записывает точное значение в первую часть счётчика и обнуляет остальные"""
+    values = {name: query().count() for name, query in COUNTERS.items() if names is None or name in names}
+    now = timezone.now()
+    StatCounter.objects.bulk_create(
+        [
+            StatCounter(name=name, shard=shard, value=value if shard == 0 else 0, updated_at=now)
+            for name, value in values.items() for shard in range(COUNTER_SHARDS)
+        ],
+        update_conflicts=True, unique_fields=['name', 'shard'], update_fields=['value', 'updated_at'],
+    )
+    return values
+
+
+@transaction.atomic
+def rebuild_daily(since=None):
+    """Пересчитывает DailyStat по created_at исходных таблиц, начиная с даты since"""
+    rows = []
+    for metric, model in DAILY_SOURCES.items():
+        queryset = model.objects.all()
+        if since is not None:
+            queryset = queryset.filter(created_at__date__gte=since)
+        per_day = queryset.annotate(day=TruncDate('created_at')).order_by().values_list('day').annotate(total=Count('pk'))
+        rows.extend(DailyStat(date=day, metric=metric, value=total) for day, total in per_day)
+
+    stale = DailyStat.objects.all()
+    if since is not None:
+        stale = stale.filter(date__gte=since)
+    stale.delete()
+    DailyStat.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def get_dashboard_stats():
+    """Счётчики и ряды по дням; кешируются на DASHBOARD_TIMEOUT секунд"""
+    stats = cache.get(DASHBOARD_CACHE_KEY)
+    if stats is not None:
+        return stats
+
+    counters = dict(StatCounter.objects.order_by().values_list('name').annotate(total=Sum('value')))
+    missing = COUNTERS.keys() - counters.keys()
+    if missing:
+        counters.update(reconcile_counters(missing))
+
+    today = timezone.localdate()
+    days = [today - timedelta(days=offset) for offset in range(DASHBOARD_DAYS - 1, -1, -1)]
+    daily = {(day, metric): 0 for day in days for metric in DAILY_SOURCES}
+    for day, metric, value in DailyStat.objects.filter(date__gte=days[0]).values_list('date', 'metric', 'value'):
+        daily[(day, metric)] = value
+
+    stats = {
+        'counters': counters,
+        'daily': {
+            'headers': ['Дата', *(metric.label for metric in DAILY_SOURCES)],
+            'rows': [[day.strftime('%d.%m'), *(daily[(day, metric)] for metric in DAILY_SOURCES)] for day in reversed(days)],
+        },
+    }
+    cache.set(DASHBOARD_CACHE_KEY, stats, DASHBOARD_TIMEOUT)
+    return stats
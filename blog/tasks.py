@@ -0,0 +1,43 @@
+"""
+Фоновые задачи в процессе веб-сервера.
+
+Задачи выполняются в общем пуле потоков и ставятся в очередь только после
+фиксации транзакции, чтобы поток не увидел несохранённых данных.
+Пул создаётся при первом обращении, то есть уже после fork воркера gunicorn.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections, transaction
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.BACKGROUND_WORKERS, thread_name_prefix='blog-background'
+                )
+    return _executor
+
+
+def _run(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Фоновая задача %r завершилась с ошибкой', func)
+    finally:
+        # Соединения с БД у каждого потока свои
+        connections.close_all()
+
+
+def run_in_background(func, *args, **kwargs):
+    transaction.on_commit(lambda: get_executor().submit(_run, func, args, kwargs))
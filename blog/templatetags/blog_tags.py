@@ -0,0 +1,95 @@
+import hashlib
+from django import template
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+from ..forms import CommentForm
+from ..models import Like
+from ..page_cache import fragment_marker, is_skeleton_request
+
+
+register = template.Library()
+
+STORY_CARD_TEMPLATE = 'blog/includes/story_card.html'
+STORY_CARD_TIMEOUT = 60 * 60
+# Карточка с оригиналом вместо ещё не созданного варианта картинки
+# живёт недолго: готовность вариантов в ключ не входит
+PENDING_VARIANTS_CARD_TIMEOUT = 60
+
+
+def story_card_cache_key(story):
+    profile = story.author.profile
+    author = hashlib.md5(f'{story.author.username}:{profile.avatar.name}'.encode()).hexdigest()[:12]
+    return f'blog:card:{story.pk}:{story.updated_at.timestamp()}:{story.like_count}:{author}'
+
+
+def _variants_pending(story):
+    """Проверяются только варианты, которые карточка запрашивала при рендере"""
+    profile = story.author.profile
+    checked = (
+        (story, 'ready_cover_variants', 'cover_image'),
+        (profile, 'ready_avatar_variants', 'avatar'),
+    )
+    return any(
+        ready in obj.__dict__ and set(obj.IMAGE_SPEC_FIELDS[field]) - obj.__dict__[ready]
+        for obj, ready, field in checked
+    )
+
+
+@register.simple_tag(takes_context=True)
+def user_fragment(context, template_name, **values):
+    """
+    Фрагмент, зависящий от посетителя. В каркасе страницы для кеша вместо
+    него выводится маркер, который заполняется при каждом запросе.
+    Значения должны быть простыми (строки, числа), они попадают в маркер.
+    """
+    request = context.get('request')
+    if request is not None and is_skeleton_request(request):
+        return fragment_marker(template_name, values)
+    fragment = context.template.engine.get_template(template_name)
+    with context.push(**values):
+        return fragment.render(context)
+
+
+@register.simple_tag(takes_context=True)
+def story_liked(context, story_pk):
+    user = context.get('user')
+    if user is None or not user.is_authenticated:
+        return False
+    return Like.objects.filter(story_id=story_pk, user=user).exists()
+
+
+@register.filter
+def avatar_url(profile, size=None):
+    """{{ user.profile|avatar_url:64 }} — аватар не меньше 64 пикселей"""
+    return profile.get_avatar_url(size)
+
+
+@register.simple_tag
+def new_comment_form():
+    return CommentForm()
+
+
+@register.simple_tag(takes_context=True)
+def story_cards(context, stories):
+    """Карточки рассказов: все кешированные достаются одним cache.get_many"""
+    stories = list(stories)
+    keys = [story_card_cache_key(story) for story in stories]
+    cached = cache.get_many(keys)
+
+    card_template = context.template.engine.get_template(STORY_CARD_TEMPLATE)
+    rendered = {}
+    pending = {}
+    cards = []
+    for story, key in zip(stories, keys):
+        card = cached.get(key)
+        if card is None:
+            with context.push(story=story):
+                card = card_template.render(context)
+            (pending if _variants_pending(story) else rendered)[key] = card
+        cards.append(card)
+
+    if rendered:
+        cache.set_many(rendered, STORY_CARD_TIMEOUT)
+    if pending:
+        cache.set_many(pending, PENDING_VARIANTS_CARD_TIMEOUT)
+    return mark_safe(''.join(cards))
@@ -1,3 +1,1095 @@
-from django.test import TestCase
+import importlib
+import os
+import re
+import shutil
+import tempfile
+import time
+import warnings
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+from unittest.mock import patch
+from django.conf import settings
+from django.contrib.admin.models import CHANGE, LogEntry
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.template import Context, Template
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+from imagekit.cachefiles.backends import CacheFileState
+from PIL import Image
+from story_project import urls as project_urls
+from . import async_views, sitemaps, urls as blog_urls
+from .admin import CommentAdmin
+from .caching import LISTING_TTL, get_listing_generation, get_story_version
+from .counters import add_like, reconcile_counters as reconcile_story_counters, remove_like
+from .imagegenerators import COVER_FORMATS, COVER_WIDTHS
+from .images import COVER_MAX_SIZE
+from .models import (
+    Category, Comment, DailyStat, DeferredContentError, DeferredContentWarning, Like, StatCounter, Story, UserProfile,
+)
+from .page_cache import FRAGMENT_SALT, fill_fragments, fragment_marker
+from .rendering import EXCERPT_WORDS, render_markdown
+from .search import search_stories
+from .signals import story_unpublished
+from .templatetags.blog_tags import PENDING_VARIANTS_CARD_TIMEOUT, STORY_CARD_TIMEOUT
+from .stats import COUNTER_SHARDS, DASHBOARD_CACHE_KEY, get_dashboard_stats, reconcile_counters
+from .transfer import (
+    FORMATS, CategoryTransfer, CommentTransfer, StoryTransfer, TransferError, read_rows, write_rows,
+)
 
-# Create your tests here.
+
+# Манифест collectstatic в тестах не собирается
+@override_settings(STORAGES={
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class BlogTestCase(TestCase):
+    """Общий кеш (версии, страницы) не откатывается вместе с транзакцией теста"""
+
+    def setUp(self):
+        cache.clear()
+
+    @staticmethod
+    def create_story(author, title='Рассказ', status=Story.Status.PUBLISHED, **kwargs):
+        return Story.objects.create(title=title, content=kwargs.pop('content', 'Текст рассказа'), author=author,
+                                    status=status, **kwargs)
+
+
+class SearchTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('writer')
+        self.other = User.objects.create_user('другой')
+        self.title_match = self.create_story(self.other, title='Ночной маяк', content='Волны')
+        self.body_match = self.create_story(self.other, title='Берег', content='Вдали светил маяк')
+        self.by_author = self.create_story(self.author, title='Без совпадений', content='Туман')
+        self.create_story(self.other, title='Черновик про маяк', status=Story.Status.DRAFT)
+
+    def search(self, query):
+        return list(search_stories(Story.published.for_cards(), query))
+
+    def test_orders_by_relevance(self):
+        self.assertEqual(self.search('маяк'), [self.title_match, self.body_match])
+
+    def test_includes_stories_of_matching_author(self):
+        self.assertEqual(self.search('writer'), [self.by_author])
+        self.assertEqual(self.search('RIT'), [self.by_author])
+
+    def test_author_story_matching_text_is_listed_once(self):
+        story = self.create_story(self.author, title='Маяк writer')
+        self.assertEqual(self.search('writer'), [story, self.by_author])
+
+
+class PageCacheTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('writer', password='secret')
+        self.story = self.create_story(self.author, title='Маяк')
+        self.url = self.story.get_absolute_url()
+
+    def test_fragment_marker_renders_for_current_user(self):
+        request = RequestFactory().get('/')
+        request.user = self.author
+        content = fill_fragments(fragment_marker('blog/includes/navbar_user.html', {}), request)
+        self.assertIn(reverse('blog:user_stories', args=['writer']), content)
+
+    def test_tampered_fragment_marker_is_dropped(self):
+        request = RequestFactory().get('/')
+        request.user = self.author
+        payload = signing.loads(
+            fragment_marker('blog/includes/navbar_user.html', {})[len('<!--user-fragment:'):-len('-->')],
+            salt=FRAGMENT_SALT,
+        )
+        # Подмена шаблона в подписанном маркере и маркер, подписанный чужой солью
+        signature = signing.dumps(payload, salt=FRAGMENT_SALT, compress=True).rsplit(':', 1)[1]
+        tampered = signing.dumps({**payload, 't': 'registration/login.html'}, salt=FRAGMENT_SALT, compress=True)
+        forged = signing.dumps(payload, salt='blog.other', compress=True)
+        for content in (f'{tampered.rsplit(":", 1)[0]}:{signature}', forged):
+            with self.subTest(content=content):
+                self.assertEqual(fill_fragments(f'<!--user-fragment:{content}-->', request), '')
+
+    def test_anonymous_page_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.content, first.content)
+
+    def test_cached_skeleton_is_filled_per_user(self):
+        reader = User.objects.create_user('reader')
+        anonymous = self.client.get(self.url).content.decode()
+        self.client.force_login(reader)
+        personal = self.client.get(self.url).content.decode()
+        own_stories = reverse('blog:user_stories', args=['reader'])
+        self.assertNotIn(own_stories, anonymous)
+        self.assertIn(own_stories, personal)
+        self.assertIn('csrfmiddlewaretoken', personal)
+        self.assertNotIn('user-fragment:', personal)
+
+    def csrf_client_login(self, client):
+        client.get(reverse('login'))
+        response = client.post(reverse('login'), {
+            'username': 'writer', 'password': 'secret', 'csrfmiddlewaretoken': client.cookies['csrftoken'].value,
+        })
+        self.assertEqual(response.status_code, 302)
+
+    def page_token(self, response):
+        return re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode()).group(1)
+
+    def test_etag_changes_with_session_and_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        self.csrf_client_login(client)
+        page = client.get(self.url)
+        etag = page['ETag']
+        self.assertIn('Cookie', page['Vary'])
+        not_modified = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertIn('Cookie', not_modified['Vary'])
+
+        # Токен со страницы, которую браузер взял из своего кеша после 304, принимается
+        comment_url = reverse('blog:add_comment', args=[self.story.slug])
+        response = client.post(comment_url, {'content': 'Отзыв', 'csrfmiddlewaretoken': self.page_token(page)})
+        self.assertEqual(response.status_code, 302)
+
+        # После выхода и входа токен со старой страницы устарел, поэтому 304 быть не должно
+        client.post(reverse('logout'), {'csrfmiddlewaretoken': client.cookies['csrftoken'].value})
+        self.csrf_client_login(client)
+        page = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(page.status_code, 200)
+        self.assertNotEqual(page['ETag'], etag)
+        response = client.post(comment_url, {'content': 'Ещё отзыв', 'csrfmiddlewaretoken': self.page_token(page)})
+        self.assertEqual(response.status_code, 302)
+
+    def test_category_rename_changes_story_etag(self):
+        category = Category.objects.create(name='Фантастика')
+        self.story.category = category
+        self.story.save()
+        etag = self.client.get(self.url)['ETag']
+        category.name = 'Научная фантастика'
+        category.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Научная фантастика')
+
+    def test_deleted_category_drops_from_cached_anonymous_page(self):
+        category = Category.objects.create(name='Cat A')
+        self.story.category = category
+        self.story.save()
+        category_url = reverse('blog:category_stories', args=[category.slug])
+        self.assertContains(self.client.get(self.url), category_url)
+        category.delete()
+        self.assertNotContains(self.client.get(self.url), category_url)
+
+    def test_profile_change_invalidates_story_pages(self):
+        reader = User.objects.create_user('reader')
+        Comment.objects.create(story=self.create_story(self.author, title='Другой'), author=reader, content='Отзыв', is_active=True)
+        commented = Story.objects.get(title='Другой')
+        versions = {pk: get_story_version(pk) for pk in (self.story.pk, commented.pk)}
+        self.author.profile.save()
+        self.assertNotEqual(get_story_version(self.story.pk), versions[self.story.pk])
+        self.assertNotEqual(get_story_version(commented.pk), versions[commented.pk])
+        versions = {pk: get_story_version(pk) for pk in (self.story.pk, commented.pk)}
+        reader.profile.save()
+        self.assertEqual(get_story_version(self.story.pk), versions[self.story.pk])
+        self.assertNotEqual(get_story_version(commented.pk), versions[commented.pk])
+
+    def test_story_change_invalidates_cached_page(self):
+        self.client.get(self.url)
+        self.story.title = 'Новый маяк'
+        self.story.save()
+        self.assertContains(self.client.get(self.url), 'Новый маяк')
+
+
+class ImageVariantTests(BlogTestCase):
+    def test_missing_variants_fall_back_to_original_and_are_rescheduled(self):
+        story = Story(cover_image='story_covers/lost.webp')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(story.get_cover_sources(), [])
+            self.assertEqual(story.get_cover_thumbnail_url(), story.cover_image.url)
+        self.assertEqual(len(callbacks), len(Story.IMAGE_SPEC_FIELDS['cover_image']))
+
+        # Пока задачи в очереди, повторный показ не ставит их снова
+        with self.captureOnCommitCallbacks() as callbacks:
+            Story(cover_image='story_covers/lost.webp').get_cover_sources()
+        self.assertEqual(callbacks, [])
+
+    def test_generated_variants_are_listed(self):
+        story = Story(cover_image='story_covers/ready.webp')
+        variant = story.cover_webp_800
+        variant.cachefile_backend.set_state(variant, CacheFileState.EXISTS)
+        with self.captureOnCommitCallbacks():
+            sources = story.get_cover_sources()
+        self.assertEqual(sources, [(COVER_FORMATS['webp'][0], f'{variant.url} 800w')])
+        self.assertEqual(len(COVER_WIDTHS), 3)
+
+    def test_avatar_falls_back_to_larger_variant_or_original(self):
+        profile = UserProfile(avatar='avatars/face.webp')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(profile.get_avatar_url(32), profile.avatar.url)
+        self.assertEqual(len(callbacks), len(UserProfile.IMAGE_SPEC_FIELDS['avatar']))
+
+        profile = UserProfile(avatar='avatars/face.webp')
+        variant = profile.avatar_64
+        variant.cachefile_backend.set_state(variant, CacheFileState.EXISTS)
+        with self.captureOnCommitCallbacks():
+            # Варианта 32 нет, подходит следующий по размеру
+            self.assertEqual(profile.get_avatar_url(32), variant.url)
+            self.assertEqual(profile.get_avatar_url(64), variant.url)
+            self.assertEqual(profile.get_avatar_url(128), profile.avatar.url)
+            self.assertEqual(profile.get_avatar_url(), profile.avatar.url)
+        self.assertEqual(UserProfile().get_avatar_url(32), '/static/images/default-avatar.png')
+
+
+class UploadTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = self.settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    @staticmethod
+    def image_file(name, size=(40, 30), image_format='JPEG', **save_kwargs):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, image_format, **save_kwargs)
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def assertRejected(self, file):
+        field = Story._meta.get_field('cover_image')
+        with self.assertRaises(ValidationError):
+            field.run_validators(file)
+
+    def test_fake_and_oversized_uploads_are_rejected(self):
+        self.assertRejected(SimpleUploadedFile('cover.jpg', b'<?php echo 1; ?>'))
+        # Расширение не совпадает с содержимым
+        self.assertRejected(self.image_file('cover.jpg', image_format='GIF'))
+        self.assertRejected(SimpleUploadedFile('cover.jpg', b'\0' * (5 * 1024 * 1024 + 1)))
+        with patch('blog.validators.MAX_IMAGE_PIXELS', 1000):
+            self.assertRejected(self.image_file('cover.jpg'))
+        Story._meta.get_field('cover_image').run_validators(self.image_file('cover.jpg'))
+
+    def test_uploads_are_reencoded_without_metadata(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90°
+        exif[0x010F] = 'Телефон'
+        cover = self.image_file('photo.jpg', size=(3000, 100), exif=exif)
+        story = self.create_story(User.objects.create_user('writer'), cover_image=cover)
+        self.assertTrue(story.cover_image.name.endswith('.webp'))
+        # Поворот применён к пикселям, длинная сторона ограничена
+        self.assertEqual((story.cover_width, story.cover_height), (80, COVER_MAX_SIZE))
+        with default_storage.open(story.cover_image.name) as file, Image.open(file) as image:
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(image.size, (80, COVER_MAX_SIZE))
+            self.assertEqual(len(image.getexif()), 0)
+
+
+class DeferredSaveTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('writer')
+        self.story = self.create_story(self.author, title='Маяк', content='Текст *рассказа*')
+
+    def save_queries(self, story):
+        story.title += '!'
+        with CaptureQueriesContext(connection) as queries:
+            story.save()
+        return len(queries)
+
+    def test_deferred_fields_are_not_loaded_on_save(self):
+        loaded = self.save_queries(Story.objects.get(pk=self.story.pk))
+        # imagekit читает cover_image в post_save, поэтому во всех вариантах оно загружено
+        for queryset in (
+            Story.objects.for_cards(),
+            Story.objects.without_content(),
+            Story.objects.defer('content_html'),
+            Story.objects.only('title', 'cover_image'),
+        ):
+            story = queryset.get(pk=self.story.pk)
+            with self.subTest(deferred=sorted(story.get_deferred_fields())), self.assertNumQueries(loaded):
+                story.title += '!'
+                story.save()
+
+    def test_status_assigned_after_deferred_load_is_compared_with_database(self):
+        received = []
+
+        def receiver(sender, instance, **kwargs):
+            received.append(instance.pk)
+
+        story_unpublished.connect(receiver)
+        self.addCleanup(story_unpublished.disconnect, receiver)
+        story = Story.objects.only('title', 'cover_image').get(pk=self.story.pk)
+        story.status = Story.Status.DRAFT
+        with CaptureQueriesContext(connection) as queries:
+            story.save()
+        status_reads = [query for query in queries if query['sql'].startswith('SELECT "blog_story"."status"')]
+        self.assertEqual(len(status_reads), 1)
+        self.assertEqual(received, [self.story.pk])
+        self.assertIsNone(Story.objects.get(pk=self.story.pk).published_at)
+
+    @override_settings(DEFERRED_CONTENT_GUARD='raise')
+    def test_guard_raises_on_deferred_content_access(self):
+        story = Story.objects.without_content().get(pk=self.story.pk)
+        with self.assertRaises(DeferredContentError), self.assertNumQueries(0):
+            story.content
+        # Поля вне содержимого догружаются как обычно
+        Story.objects.only('title').get(pk=self.story.pk).excerpt
+
+    @override_settings(DEFERRED_CONTENT_GUARD='warn')
+    def test_guard_warns_and_loads_deferred_content(self):
+        story = Story.objects.without_content().get(pk=self.story.pk)
+        with self.assertWarns(DeferredContentWarning), self.assertNumQueries(1):
+            self.assertEqual(story.content, 'Текст *рассказа*')
+
+    @override_settings(DEFERRED_CONTENT_GUARD='off', DEBUG=True)
+    def test_guard_can_be_disabled(self):
+        story = Story.objects.without_content().get(pk=self.story.pk)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeferredContentWarning)
+            self.assertEqual(story.content, 'Текст *рассказа*')
+
+
+class SlugTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('writer')
+
+    def test_long_titles_get_distinct_truncated_slugs(self):
+        max_length = Story._meta.get_field('slug').max_length
+        stories = [self.create_story(self.author, title='Щ' * 120) for _ in range(12)]
+        slugs = [story.slug for story in stories]
+        self.assertEqual(len(set(slugs)), len(slugs))
+        self.assertTrue(all(len(slug) <= max_length for slug in slugs))
+        self.assertTrue(slugs[2].endswith('-3'))
+        self.assertTrue(slugs[11].endswith('-12'))
+
+    def test_cyrillic_titles_and_bulk_create(self):
+        first = self.create_story(self.author, title='Ночной маяк')
+        self.create_story(self.author, title='Ночной маяк')
+        stories = [
+            Story(title=title, content='Текст', author=self.author)
+            for title in ('Ночной маяк', 'Ночной маяк', 'Щ' * 120, 'Щ' * 120)
+        ]
+        for story in stories:
+            story.prepare_for_bulk()
+        Story.objects.bulk_create(stories)
+        slugs = list(Story.objects.order_by('pk').values_list('slug', flat=True))
+        self.assertEqual(len(set(slugs)), 6)
+        self.assertEqual(slugs[:4], [first.slug, f'{first.slug}-2', f'{first.slug}-3', f'{first.slug}-4'])
+
+
+class StatCounterTests(BlogTestCase):
+    def test_changes_are_spread_over_shards_and_summed(self):
+        author = User.objects.create_user('writer')
+        for number in range(30):
+            self.create_story(author, title=f'Рассказ {number}')
+        self.assertEqual(StatCounter.objects.filter(name='stories').count(), COUNTER_SHARDS)
+        self.assertGreater(StatCounter.objects.filter(name='stories', value__gt=0).count(), 1)
+        self.assertEqual(get_dashboard_stats()['counters']['stories'], 30)
+
+    def test_reconcile_moves_value_to_first_shard(self):
+        author = User.objects.create_user('writer')
+        self.create_story(author)
+        StatCounter.objects.filter(name='stories').update(value=5)
+        self.assertEqual(reconcile_counters(['stories']), {'stories': 1})
+        values = dict(StatCounter.objects.filter(name='stories').values_list('shard', 'value'))
+        self.assertEqual(values, {0: 1, **{shard: 0 for shard in range(1, COUNTER_SHARDS)}})
+
+
+class ModerationTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', password='secret')
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:blog_comment_moderation')
+        story = self.create_story(self.admin)
+        self.comments = [Comment.objects.create(story=story, author=self.admin, content=f'№{n}') for n in range(3)]
+
+    def test_reject_keeps_comment_and_logs_decision(self):
+        comment = self.comments[0]
+        response = self.client.post(self.url, {'comment': [comment.pk], 'decision': 'reject'})
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        comment.refresh_from_db()
+        self.assertTrue(comment.is_rejected)
+        self.assertFalse(comment.is_active)
+        entry = LogEntry.objects.get(object_id=str(comment.pk))
+        self.assertEqual((entry.user, entry.action_flag, entry.change_message), (self.admin, CHANGE, 'Отклонён'))
+        self.assertNotContains(self.client.get(self.url), '№0')
+
+    def test_decision_returns_to_same_cursor(self):
+        with patch.object(CommentAdmin, 'moderation_per_page', 2):
+            cursor = self.client.get(self.url).context['page_obj'].next_cursor
+            second_page = self.client.get(self.url, {'cursor': cursor})
+            self.assertContains(second_page, f'name="cursor" value="{cursor}"')
+            response = self.client.post(self.url, {'comment': [self.comments[0].pk], 'decision': 'approve', 'cursor': cursor})
+        self.assertRedirects(response, f'{self.url}?cursor={cursor}', fetch_redirect_response=False)
+        self.assertTrue(Comment.objects.get(pk=self.comments[0].pk).is_active)
+
+    def test_pending_count_follows_new_comments_and_admin_actions(self):
+        def pending_count():
+            return self.client.get(self.url).context['pending_count']
+
+        # На нескольких страницах число берётся из кеша
+        with patch.object(CommentAdmin, 'moderation_per_page', 2):
+            self.assertEqual(pending_count(), 3)
+            Comment.objects.create(story=self.comments[0].story, author=self.admin, content='Новый')
+            self.assertEqual(pending_count(), 4)
+            self.client.post(reverse('admin:blog_comment_changelist'), {
+                'action': 'approve_comments', '_selected_action': [self.comments[0].pk, self.comments[1].pk],
+            })
+            self.assertEqual(pending_count(), 2)
+            self.comments[2].delete()
+            self.assertEqual(pending_count(), 1)
+
+
+class AdminChangelistTests(BlogTestCase):
+    """Число запросов списков в админке не зависит от числа строк"""
+    CHANGELISTS = ('story', 'category', 'comment', 'like', 'userprofile')
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', password='secret')
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        for _ in range(count):
+            number = User.objects.count()
+            author = User.objects.create_user(f'writer{number}')
+            category = Category.objects.create(name=f'Категория {number}')
+            story = self.create_story(author, title=f'Рассказ {number}', category=category)
+            Comment.objects.create(story=story, author=author, content='Отлично')
+            Like.objects.create(story=story, user=author)
+
+    def changelist_queries(self, model_name, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:blog_{model_name}_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_rows(2)
+        counts = {model_name: self.changelist_queries(model_name) for model_name in self.CHANGELISTS}
+        self.add_rows(5)
+        for model_name in self.CHANGELISTS:
+            with self.subTest(changelist=model_name):
+                self.assertEqual(self.changelist_queries(model_name), counts[model_name])
+
+    def test_sorting_by_story_count(self):
+        self.add_rows(2)
+        # Колонка с числом рассказов — третья в list_display после флажка действий
+        for model_name in ('category', 'userprofile'):
+            with self.subTest(changelist=model_name):
+                response = self.client.get(reverse(f'admin:blog_{model_name}_changelist'), {'o': '-3'})
+                self.assertEqual(response.context['cl'].get_ordering_field_columns(), {3: 'desc'})
+
+
+class QueryPlanTests(BlogTestCase):
+    """Запросы основных страниц идут по индексам (EXPLAIN на тестовой БД)"""
+    SCAN_RE = {
+        'sqlite': re.compile(r'^SCAN (\w+)$'),
+        'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    }
+    # Справочники, которые читаются целиком и остаются маленькими
+    ALLOWED_TABLES = ('blog_category', 'django_content_type')
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [User.objects.create(username=f'explain-{i}') for i in range(20)]
+        categories = [Category.objects.create(name=f'Explain {i}') for i in range(10)]
+        stories = []
+        for i in range(500):
+            story = Story(
+                title=f'Explain {i % 20}', content=f'Рассказ {i}', author=users[i % len(users)],
+                category=categories[i % len(categories)],
+                status=Story.Status.PUBLISHED if i % 5 else Story.Status.DRAFT,
+            )
+            story.prepare_for_bulk()
+            stories.append(story)
+        Story.objects.bulk_create(stories)
+        published = list(Story.published.order_by('-pk')[:20])
+        Comment.objects.bulk_create([
+            Comment(story=story, author=user, content='Комментарий', is_active=j % 3 != 0)
+            for story in published for j, user in enumerate(users)
+        ])
+        Like.objects.bulk_create([Like(story=story, user=user) for story in published for user in users[::2]])
+        cls.story, cls.user, cls.category = published[0], users[0], categories[0]
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor not in self.SCAN_RE:
+            self.skipTest(f'EXPLAIN для {connection.vendor} не поддерживается')
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # На маленьком наборе планировщик и так предпочтёт полное чтение
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('ANALYZE blog_story, blog_comment, blog_like, auth_user')
+            else:
+                cursor.execute('ANALYZE')
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                return [row[3] for row in cursor.fetchall()]
+            cursor.execute(f'EXPLAIN {sql}')
+            return [line for (line,) in cursor.fetchall()]
+
+    def page_plans(self, url, user=None):
+        if user is not None:
+            self.client.force_login(user)
+        # Кеш страниц скрыл бы запросы представлений
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+        selects = [query['sql'] for query in queries if query['sql'].lstrip().upper().startswith('SELECT')]
+        return {sql: self.explain(sql) for sql in selects}
+
+    def assert_no_full_scans(self, plans):
+        pattern = self.SCAN_RE[connection.vendor]
+        for sql, plan in plans.items():
+            for line in plan:
+                match = pattern.search(line)
+                with self.subTest(sql=sql):
+                    self.assertFalse(match and match.group(1) not in self.ALLOWED_TABLES, f'{line}\n{sql}')
+
+    def assert_uses_index(self, plans, index):
+        self.assertTrue(any(index in line for plan in plans.values() for line in plan), index)
+
+    def test_listings_use_published_indexes(self):
+        for url, index in (
+            (reverse('blog:story_list'), 'story_published_idx'),
+            (reverse('blog:category_stories', args=[self.category.slug]), 'story_category_published_idx'),
+            (reverse('blog:user_stories', args=[self.user.username]), 'story_author_published_idx'),
+        ):
+            with self.subTest(url=url):
+                plans = self.page_plans(url)
+                self.assert_no_full_scans(plans)
+                self.assert_uses_index(plans, index)
+
+    def test_story_page_uses_active_comment_index(self):
+        url = self.story.get_absolute_url()
+        for user in (None, self.user):
+            with self.subTest(user=user):
+                plans = self.page_plans(url, user)
+                self.assert_no_full_scans(plans)
+                self.assert_uses_index(plans, 'comment_story_active_idx')
+
+    def test_dashboard_has_no_full_scans(self):
+        self.assert_no_full_scans(self.page_plans(reverse('blog:dashboard'), self.user))
+
+
+class LikeApiTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader = User.objects.create_user('reader')
+        self.story = self.create_story(User.objects.create_user('writer'))
+        self.url = reverse('blog:story_like_api', args=[self.story.slug])
+
+    def like_state(self):
+        self.story.refresh_from_db(fields=['like_count'])
+        return self.story.like_count, Like.objects.filter(story=self.story).count(), get_dashboard_stats()['counters']['total_likes']
+
+    def test_repeated_put_and_delete_are_idempotent(self):
+        self.client.force_login(self.reader)
+        for method, liked, count in (('put', True, 1), ('put', True, 1), ('delete', False, 0), ('delete', False, 0)):
+            with self.subTest(method=method):
+                cache.delete(DASHBOARD_CACHE_KEY)
+                response = getattr(self.client, method)(self.url)
+                self.assertEqual(response.json(), {'liked': liked, 'like_count': count})
+                self.assertEqual(self.like_state(), (count, count, count))
+
+    def test_remove_like_updates_counters_once(self):
+        add_like(self.story.pk, self.reader)
+        daily = DailyStat.objects.get(metric=DailyStat.Metric.LIKES)
+        self.assertEqual(daily.value, 1)
+        self.assertTrue(remove_like(self.story.pk, self.reader))
+        self.assertFalse(remove_like(self.story.pk, self.reader))
+        cache.delete(DASHBOARD_CACHE_KEY)
+        self.assertEqual(self.like_state(), (0, 0, 0))
+        daily.refresh_from_db()
+        self.assertEqual(daily.value, 0)
+
+    def test_like_keeps_listing_cache(self):
+        self.client.force_login(self.reader)
+        generation = get_listing_generation()
+        story_version = get_story_version(self.story.pk)
+        self.client.put(self.url)
+        self.assertEqual(get_listing_generation(), generation)
+        self.assertNotEqual(get_story_version(self.story.pk), story_version)
+
+    def test_listing_etag_expires_after_ttl(self):
+        url = reverse('blog:story_list')
+        now = time.time_ns()
+        with patch('blog.caching.time.time_ns', return_value=now):
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with patch('blog.caching.time.time_ns', return_value=now + LISTING_TTL * 10 ** 9):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_anonymous_and_missing_story(self):
+        self.assertEqual(self.client.put(self.url).status_code, 401)
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.put(reverse('blog:story_like_api', args=['нет-такого'])).status_code, 404)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+    def test_rate_limited(self):
+        self.client.force_login(self.reader)
+        # Все запросы в одном окне лимита
+        with patch('django_ratelimit.core.time.time', return_value=1_000_000_000):
+            statuses = [self.client.put(self.url).status_code for _ in range(11)]
+        self.assertEqual(statuses, [200] * 10 + [429])
+
+
+def use_async_views(enabled):
+    """Пересобирает адреса с синхронными или асинхронными публичными страницами"""
+    with override_settings(ASYNC_VIEWS=enabled):
+        importlib.reload(blog_urls)
+        importlib.reload(project_urls)
+    clear_url_caches()
+
+
+class AsyncViewTests(BlogTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        use_async_views(True)
+        cls.addClassCleanup(use_async_views, False)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('writer')
+        cls.category = Category.objects.create(name='Фантастика')
+        cls.stories = [
+            cls.create_story(cls.author, title=f'Рассказ {number}', category=cls.category) for number in range(8)
+        ]
+        cls.create_story(cls.author, title='Черновик', status=Story.Status.DRAFT)
+        Comment.objects.bulk_create([
+            Comment(story=cls.stories[0], author=cls.author, content=f'Отзыв {number}', is_active=True)
+            for number in range(12)
+        ])
+        reconcile_story_counters([cls.stories[0].pk])
+
+    def test_public_pages_are_served_by_async_views(self):
+        for url, view_class in (
+            (reverse('blog:story_list'), async_views.StoryListView),
+            (self.stories[0].get_absolute_url(), async_views.StoryDetailView),
+            (reverse('blog:user_stories', args=['writer']), async_views.UserStoryListView),
+            (reverse('blog:category_stories', args=[self.category.slug]), async_views.CategoryStoryListView),
+        ):
+            with self.subTest(url=url):
+                self.assertIs(resolve(url).func.view_class, view_class)
+
+    async def test_story_list_pages_by_cursor(self):
+        first = await self.async_client.get(reverse('blog:story_list'))
+        self.assertEqual(first.status_code, 200)
+        page = first.context['page_obj']
+        self.assertEqual([story.title for story in page], [f'Рассказ {number}' for number in range(7, 1, -1)])
+        self.assertEqual(first.context['featured_story'], self.stories[-1])
+        self.assertEqual(first.context['paginator'].count, 8)
+
+        second = await self.async_client.get(reverse('blog:story_list'), {'cursor': page.next_cursor})
+        self.assertEqual([story.title for story in second.context['page_obj']], ['Рассказ 1', 'Рассказ 0'])
+        self.assertEqual((await self.async_client.get(reverse('blog:story_list'), {'cursor': 'x'})).status_code, 404)
+
+    async def test_story_detail_paginates_comments(self):
+        url = self.stories[0].get_absolute_url()
+        response = await self.async_client.get(url, {'page': 99})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['story'], self.stories[0])
+        comments = response.context['comments']
+        self.assertEqual((comments.number, len(comments.object_list)), (2, 2))
+        self.assertContains(response, 'Отзыв 0')
+        missing = await self.async_client.get(reverse('blog:story_detail', args=['нет-такого']))
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_author_and_category_pages(self):
+        response = await self.async_client.get(reverse('blog:user_stories', args=['writer']))
+        self.assertEqual(response.context['author'], self.author)
+        self.assertEqual(response.context['total_comments'], 12)
+        self.assertEqual(response.context['paginator'].count, 8)
+        response = await self.async_client.get(reverse('blog:category_stories', args=[self.category.slug]))
+        self.assertEqual(len(response.context['page_obj']), 5)
+        self.assertNotContains(response, 'Черновик')
+
+
+class FeedTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('writer')
+        self.category = Category.objects.create(name='Фантастика')
+        self.story = self.create_story(self.author, title='Маяк', content='Текст *рассказа*', category=self.category)
+        self.create_story(self.author, title='Черновик', status=Story.Status.DRAFT)
+
+    def test_feeds_list_published_stories_with_full_text(self):
+        for name, args in (
+            ('story_feed', []), ('category_feed', [self.category.slug]), ('author_feed', ['writer']),
+        ):
+            for kind, content_tag in (('rss', 'content:encoded'), ('atom', 'content')):
+                with self.subTest(name=name, kind=kind):
+                    response = self.client.get(reverse(f'blog:{name}_{kind}', args=args))
+                    self.assertEqual(response.status_code, 200)
+                    content = response.content.decode()
+                    self.assertIn('<title>Маяк</title>', content)
+                    self.assertIn(f'<{content_tag}', content)
+                    self.assertIn('&lt;em&gt;рассказа&lt;/em&gt;', content)
+                    self.assertNotIn('Черновик', content)
+
+    def test_feed_is_cached_until_publication(self):
+        url = reverse('blog:story_feed_rss')
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).content, first.content)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        self.create_story(self.author, title='Новый маяк')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новый маяк')
+
+    def test_unknown_category_or_author(self):
+        self.assertEqual(self.client.get(reverse('blog:category_feed_rss', args=['нет'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('blog:author_feed_atom', args=['нет'])).status_code, 404)
+
+
+def run_on_commit(func, *args, **kwargs):
+    """run_in_background без пула потоков: поток не видит транзакцию теста"""
+    transaction.on_commit(lambda: func(*args, **kwargs))
+
+
+@patch('blog.signals.run_in_background', run_on_commit)
+@patch('blog.transfer.run_in_background', run_on_commit)
+class SitemapTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = self.settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.author = User.objects.create_user('writer')
+
+    def read(self, name):
+        with default_storage.open(name) as file:
+            return file.read().decode()
+
+    def story_url(self, slug):
+        return sitemaps.absolute_url(reverse('blog:story_detail', args=[slug]))
+
+    def test_publish_rewrites_shard_and_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            story = self.create_story(self.author, title='Маяк')
+        shard = self.read(sitemaps.shard_name('stories', 0))
+        self.assertIn(self.story_url(story.slug), shard)
+        index = self.read(sitemaps.INDEX_NAME)
+        self.assertIn(reverse('blog:sitemap_shard', args=['stories', 0]), index)
+        self.assertIn(reverse('blog:sitemap_shard', args=['authors', 0]), index)
+        files = os.listdir(os.path.join(settings.MEDIA_ROOT, sitemaps.SITEMAP_DIR))
+        self.assertEqual([name for name in files if name.endswith('.tmp')], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            story.status = Story.Status.DRAFT
+            story.save()
+        self.assertFalse(default_storage.exists(sitemaps.shard_name('stories', 0)))
+        self.assertNotIn('stories-0', self.read(sitemaps.INDEX_NAME))
+
+    def test_slug_change_rewrites_shard(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            story = self.create_story(self.author, title='Маяк')
+        story = Story.objects.for_cards().get(pk=story.pk)
+        old_url = self.story_url(story.slug)
+        with self.captureOnCommitCallbacks(execute=True):
+            story.slug = 'novyi-mayak'
+            story.save()
+        shard = self.read(sitemaps.shard_name('stories', 0))
+        self.assertIn(self.story_url('novyi-mayak'), shard)
+        self.assertNotIn(old_url, shard)
+
+    def test_import_rewrites_shards(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = StoryTransfer().import_rows([
+                {'title': 'Импорт', 'content': 'Текст', 'author': 'writer', 'status': Story.Status.PUBLISHED},
+            ])
+        self.assertEqual(result.created, 1)
+        story = Story.objects.get(title='Импорт')
+        self.assertIn(self.story_url(story.slug), self.read(sitemaps.shard_name('stories', 0)))
+        self.assertIn('/author/writer/', self.read(sitemaps.shard_name('authors', 0)))
+
+    def test_index_skips_vanished_shards(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_story(self.author)
+        vanished = ('stories', 7, 'stories-7.xml')
+        with patch('blog.sitemaps._shard_files', return_value=[vanished, *sitemaps._shard_files()]):
+            with sitemaps.rebuild_lock():
+                sitemaps.write_index()
+        index = self.read(sitemaps.INDEX_NAME)
+        self.assertNotIn('stories-7', index)
+        self.assertIn('stories-0', index)
+
+    def test_rebuild_waits_for_lock(self):
+        with sitemaps.rebuild_lock():
+            with self.assertRaises(TimeoutError), patch('blog.sitemaps.LOCK_POLL_INTERVAL', 0.01):
+                with sitemaps.rebuild_lock(timeout=0.05):
+                    pass
+        # Блокировка снята, следующая сборка проходит
+        self.assertEqual(sitemaps.build_sitemaps(), {'stories': 0, 'categories': 0, 'authors': 0})
+
+    def test_update_does_not_wait_for_lock(self):
+        story = self.create_story(self.author, title='Маяк')
+        with sitemaps.rebuild_lock():
+            sitemaps.update_shards({'stories': [story.pk]})
+        self.assertFalse(default_storage.exists(sitemaps.shard_name('stories', 0)))
+        # Отмеченную часть пересобирает следующий, кто получит блокировку
+        sitemaps.rebuild_marked()
+        self.assertIn(self.story_url(story.slug), self.read(sitemaps.shard_name('stories', 0)))
+
+    def test_shards_marked_during_rebuild_are_rebuilt_by_lock_holder(self):
+        first = self.create_story(self.author, title='Маяк')
+        second = []
+        write_shard = sitemaps.write_shard
+
+        def write_and_publish(section, number):
+            count = write_shard(section, number)
+            if not second:
+                # Воркер другого процесса публикует рассказ, пока часть пишется
+                second.append(self.create_story(self.author, title='Берег'))
+                sitemaps.update_shards({'stories': [second[0].pk]})
+            return count
+
+        with patch('blog.sitemaps.write_shard', write_and_publish):
+            sitemaps.update_shards({'stories': [first.pk]})
+        shard = self.read(sitemaps.shard_name('stories', 0))
+        self.assertIn(self.story_url(first.slug), shard)
+        self.assertIn(self.story_url(second[0].slug), shard)
+
+    def test_edit_of_published_story_refreshes_lastmod(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            story = self.create_story(self.author, title='Маяк')
+        Story.objects.filter(pk=story.pk).update(updated_at=story.updated_at - timedelta(days=1))
+        story = Story.objects.get(pk=story.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            story.content = 'Новый текст'
+            story.save()
+        self.assertIn(f'<lastmod>{story.updated_at.isoformat()}</lastmod>', self.read(sitemaps.shard_name('stories', 0)))
+
+    def test_category_and_username_changes_rewrite_shards(self):
+        category = Category.objects.create(name='Проза', slug='proza')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_story(self.author, category=category)
+        with self.captureOnCommitCallbacks(execute=True):
+            category.slug = 'novaya-proza'
+            category.save()
+            self.author.username = 'pisatel'
+            self.author.save()
+        categories = self.read(sitemaps.shard_name('categories', 0))
+        self.assertIn('/category/novaya-proza/', categories)
+        self.assertNotIn('/category/proza/', categories)
+        authors = self.read(sitemaps.shard_name('authors', 0))
+        self.assertIn('/author/pisatel/', authors)
+        self.assertNotIn('/author/writer/', authors)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            category.delete()
+        self.assertFalse(default_storage.exists(sitemaps.shard_name('categories', 0)))
+
+    def test_login_does_not_query_username(self):
+        with self.assertNumQueries(1):
+            self.author.save(update_fields=['last_login'])
+
+
+class TransferTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('writer')
+        self.category = Category.objects.create(name='Проза', slug='proza')
+
+    def round_trip(self, transfer, queryset, format):
+        exported = ''.join(write_rows(transfer.export_rows(queryset), list(transfer.columns), format))
+        return list(read_rows(StringIO(exported), format))
+
+    def test_export_import_round_trip(self):
+        story = self.create_story(self.author, title='Маяк', category=self.category)
+        self.create_story(self.author, title='Черновик', status=Story.Status.DRAFT)
+        for format in FORMATS:
+            with self.subTest(format=format):
+                rows = self.round_trip(StoryTransfer(), Story.objects.all(), format)
+                rows[0]['title'] = f'Маяк ({format})'
+                updated_at = Story.objects.get(pk=story.pk).updated_at
+                result = StoryTransfer().import_rows(rows)
+                self.assertEqual((result.created, result.updated, result.skipped), (0, 2, []))
+                imported = Story.objects.get(pk=story.pk)
+                self.assertEqual(imported.title, f'Маяк ({format})')
+                self.assertEqual(imported.published_at, story.published_at)
+                self.assertEqual(imported.category, self.category)
+                self.assertGreater(imported.updated_at, updated_at)
+        self.assertEqual(Story.objects.count(), 2)
+
+    def test_invalid_slugs_are_normalized(self):
+        row = {'slug': 'has space/and?', 'title': 'Маяк', 'content': 'Текст', 'author': 'writer',
+               'status': Story.Status.PUBLISHED}
+        self.assertEqual(StoryTransfer().import_rows([row]).created, 1)
+        story = Story.objects.get()
+        self.assertEqual(story.slug, 'has-space-and')
+        self.assertEqual(self.client.get(story.get_absolute_url()).status_code, 200)
+        # Повторный импорт того же файла обновляет рассказ, а не создаёт новый
+        self.assertEqual(StoryTransfer().import_rows([row]).updated, 1)
+        self.assertEqual(Story.objects.count(), 1)
+
+        CategoryTransfer().import_rows([{'name': 'Поэзия', 'slug': 'стихи и песни?'}])
+        category = Category.objects.get(name='Поэзия')
+        self.assertEqual(category.slug, 'stikhi-i-pesni')
+        self.assertEqual(self.client.get(reverse('blog:category_stories', args=[category.slug])).status_code, 200)
+
+    def test_duplicate_category_slugs(self):
+        result = CategoryTransfer().import_rows([
+            {'name': 'Поэзия', 'slug': 'proza'},
+            {'name': 'Драма', 'slug': 'drama'},
+            {'name': 'Эссе', 'slug': 'drama'},
+            {'name': 'Проза', 'slug': 'drama'},
+            {'name': 'Драма', 'slug': 'drama-2'},
+        ])
+        self.assertEqual(result.created, 3)
+        self.assertEqual([row_number for row_number, _ in result.skipped], [4, 5])
+        slugs = dict(Category.objects.values_list('name', 'slug'))
+        self.assertEqual(slugs['Проза'], 'proza')
+        self.assertEqual(slugs['Драма'], 'drama')
+        self.assertEqual(len(set(slugs.values())), 4)
+
+    def test_bad_dates_are_skipped_and_naive_dates_made_aware(self):
+        rows = [
+            {'title': 'Маяк', 'content': 'Текст', 'author': 'writer', 'status': Story.Status.PUBLISHED,
+             'published_at': '2024-05-01T10:00:00'},
+            {'title': 'Берег', 'content': 'Текст', 'author': 'writer', 'published_at': 'вчера'},
+            {'title': 'Туман', 'content': 'Текст', 'author': 'writer', 'published_at': '2024-13-45'},
+        ]
+        result = StoryTransfer().import_rows(rows)
+        self.assertEqual(result.created, 1)
+        self.assertEqual([row_number for row_number, _ in result.skipped], [2, 3])
+        published_at = Story.objects.get().published_at
+        self.assertTrue(timezone.is_aware(published_at))
+        self.assertEqual(published_at, timezone.make_aware(datetime(2024, 5, 1, 10)))
+
+        story = Story.objects.get()
+        result = CommentTransfer().import_rows([
+            {'story': story.slug, 'author': 'writer', 'content': 'Хорошо', 'is_active': 'true', 'created_at': 'давно'},
+        ])
+        self.assertEqual((result.created, len(result.skipped)), (0, 1))
+
+    def test_failed_chunk_is_reported_and_earlier_chunks_kept(self):
+        import_chunk = StoryTransfer.import_chunk
+
+        def fail_second_chunk(transfer, rows, result):
+            if rows[0][0] > 1:
+                raise IntegrityError('UNIQUE constraint failed')
+            import_chunk(transfer, rows, result)
+
+        listing_generation = get_listing_generation()
+        rows = [{'title': f'Рассказ {number}', 'content': 'Текст', 'author': 'writer'} for number in range(2)]
+        with patch.object(StoryTransfer, 'import_chunk', fail_second_chunk):
+            with self.assertRaisesMessage(TransferError, 'Строки 2–2 не импортированы'):
+                StoryTransfer().import_rows(rows, chunk_size=1)
+        self.assertEqual(Story.objects.count(), 1)
+        self.assertNotEqual(get_listing_generation(), listing_generation)
+
+
+class ExcerptTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('writer')
+        self.story = self.create_story(self.author, content='Первый *абзац* рассказа')
+
+    def test_excerpt_follows_content_and_description(self):
+        self.assertEqual(self.story.plain_excerpt, 'Первый абзац рассказа')
+        self.story.content = 'Новое начало'
+        self.story.save()
+        self.assertEqual(Story.objects.get(pk=self.story.pk).plain_excerpt, 'Новое начало')
+
+        self.story.excerpt = 'Описание **автора**'
+        self.story.save()
+        self.assertEqual(Story.objects.get(pk=self.story.pk).plain_excerpt, 'Описание автора')
+        self.story.excerpt = ''
+        self.story.save()
+        self.assertEqual(Story.objects.get(pk=self.story.pk).plain_excerpt, 'Новое начало')
+
+    def test_long_content_is_truncated(self):
+        self.story.content = ' '.join(f'слово{number}' for number in range(100))
+        self.story.save()
+        self.assertEqual(len(self.story.plain_excerpt.split()), EXCERPT_WORDS)
+        self.assertTrue(self.story.plain_excerpt.endswith('...'))
+        self.assertEqual(self.story.get_plain_excerpt(5), 'слово0 слово1 слово2 слово3 слово4...')
+
+    def test_excerpt_change_invalidates_cached_card(self):
+        self.client.get(reverse('blog:story_list'))
+        self.story.excerpt = 'Совсем другое описание'
+        self.story.save()
+        self.assertContains(self.client.get(reverse('blog:story_list')), 'Совсем другое описание')
+
+
+class StoryCardTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('writer')
+        self.story = self.create_story(self.author, title='Маяк')
+
+    def render_cards(self):
+        template = Template('{% load blog_tags %}{% story_cards stories %}')
+        return template.render(Context({'stories': Story.objects.for_cards()}))
+
+    def test_avatar_change_renders_new_card(self):
+        self.render_cards()
+        # update() не вызывает сигналов: карточку меняет только ключ
+        UserProfile.objects.filter(user=self.author).update(avatar='avatars/new.webp')
+        self.assertIn('avatars/new.webp', self.render_cards())
+
+    def test_cards_with_pending_variants_expire_quickly(self):
+        Story.objects.filter(pk=self.story.pk).update(cover_image='story_covers/lost.webp')
+        with patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            self.render_cards()
+        set_many.assert_called_once()
+        self.assertEqual(set_many.call_args.args[1], PENDING_VARIANTS_CARD_TIMEOUT)
+
+        Story.objects.filter(pk=self.story.pk).update(cover_image='')
+        cache.clear()
+        with patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            self.render_cards()
+        self.assertEqual(set_many.call_args.args[1], STORY_CARD_TIMEOUT)
+
+
+class RenderStoriesTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('writer')
+        self.story = self.create_story(self.author, title='Маяк', content='Текст *рассказа*')
+        # Рассказ, сохранённый до смены настроек рендера
+        Story.objects.filter(pk=self.story.pk).update(content_html='<p>старый</p>', render_version='old')
+
+    def test_rerenders_outdated_stories_and_invalidates_pages(self):
+        url = self.story.get_absolute_url()
+        self.assertContains(self.client.get(url), 'старый')
+        listing_generation = get_listing_generation()
+        updated_at = self.story.updated_at
+        out = StringIO()
+        call_command('render_stories', stdout=out)
+        self.assertIn('обновлено: 1', out.getvalue())
+        self.story.refresh_from_db()
+        self.assertEqual(self.story.content_html, render_markdown(self.story.content))
+        self.assertGreater(self.story.updated_at, updated_at)
+        self.assertNotEqual(get_listing_generation(), listing_generation)
+        response = self.client.get(url)
+        self.assertNotContains(response, 'старый')
+        self.assertContains(response, '<em>рассказа</em>', html=True)
+
+    def test_up_to_date_stories_are_skipped(self):
+        call_command('render_stories', stdout=StringIO())
+        out = StringIO()
+        # Одна пачка и пустой запрос после неё, без UPDATE
+        with self.assertNumQueries(2):
+            call_command('render_stories', '--batch-size', '10', stdout=out)
+        self.assertIn('обновлено: 0', out.getvalue())
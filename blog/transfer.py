@@ -0,0 +1,361 @@
+"""
+Потоковый импорт и экспорт рассказов, категорий и комментариев (CSV и JSON Lines).
+
+Строки читаются и пишутся по одной, а в БД попадают пачками через
+bulk_create/bulk_update, поэтому память не зависит от размера файла.
+save() для каждой строки не вызывается: слаги, published_at, HTML и превью
+вычисляются здесь же, поисковый индекс и счётчики обновляются на пачку.
+"""
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import islice
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_unicode_slug
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from slugify import slugify
+from .models import Story, Category, Comment
+from .counters import change_comment_counts
+from . import search, caching, sitemaps
+from .tasks import run_in_background
+
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+CHUNK_SIZE = 1000
+TRUE_VALUES = {'1', 'true', 'yes', 'да'}
+
+
+class TransferError(Exception):
+    pass
+
+
+def detect_format(filename, default='jsonl'):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return extension if extension in FORMATS else default
+
+
+def read_rows(file, format):
+    """Строки файла как словари; file может быть текстовым или бинарным"""
+    if isinstance(file.read(0), bytes):
+        file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    if format == 'csv':
+        yield from csv.DictReader(file)
+        return
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise TransferError(f'Строка {line_number}: неверный JSON ({e})')
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def write_rows(rows, columns, format):
+    """Генератор строк файла для StreamingHttpResponse"""
+    if format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow(['' if row[column] is None else row[column] for column in columns])
+        return
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False, default=str) + '\n'
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def parse_date(value):
+    """Дата из файла; без часового пояса считается в текущем. Неверная — ValueError"""
+    if not value:
+        return None
+    parsed = value if isinstance(value, datetime) else parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise ValueError(f'неверная дата {value!r}')
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def clean_slug(model, value):
+    """Слаг из файла: допустимый остаётся как есть, остальные проходят через slugify"""
+    value = str(value or '').strip()
+    try:
+        validate_unicode_slug(value)
+    except ValidationError:
+        value = slugify(value)
+    return value[:model._meta.get_field('slug').max_length].strip('-')
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    updated: int = 0
+    skipped: list = field(default_factory=list)
+
+    def skip(self, row_number, reason):
+        self.skipped.append((row_number, reason))
+
+
+class Transfer:
+    model = None
+    # Колонка файла -> путь для values() при экспорте
+    columns = {}
+
+    def export_rows(self, queryset, chunk_size=CHUNK_SIZE):
+        paths = list(self.columns.values())
+        for values in queryset.order_by('pk').values_list(*paths).iterator(chunk_size=chunk_size):
+            yield {
+                column: value.isoformat() if hasattr(value, 'isoformat') else value
+                for column, value in zip(self.columns, values)
+            }
+
+    def import_rows(self, rows, chunk_size=CHUNK_SIZE):
+        result = ImportResult()
+        numbered = enumerate(rows, start=1)
+        try:
+            for chunk in chunked(numbered, chunk_size):
+                try:
+                    with transaction.atomic():
+                        self.import_chunk(chunk, result)
+                except (ValueError, IntegrityError) as e:
+                    # Предыдущие пачки уже сохранены, эта откатывается целиком
+                    raise TransferError(f'Строки {chunk[0][0]}–{chunk[-1][0]} не импортированы: {e}') from e
+        finally:
+            if result.created or result.updated:
+                caching.bump_listing_generation()
+                caching.bump_feed_generation()
+        return result
+
+    def import_chunk(self, rows, result):
+        raise NotImplementedError
+
+
+def get_users(usernames):
+    return {user.username: user for user in User.objects.filter(username__in=set(usernames) - {None, ''})}
+
+
+def get_or_create_categories(names):
+    names = set(names) - {None, ''}
+    categories = {category.name: category for category in Category.objects.filter(name__in=names)}
+    missing = [Category(name=name) for name in names - categories.keys()]
+    if missing:
+        # Слаги выделяет CategoryQuerySet.bulk_create
+        Category.objects.bulk_create(missing)
+        categories.update(
+            (category.name, category)
+            for category in Category.objects.filter(name__in=[category.name for category in missing])
+        )
+    return categories
+
+
+class CategoryTransfer(Transfer):
+    model = Category
+    columns = {'name': 'name', 'slug': 'slug'}
+
+    def import_chunk(self, rows, result):
+        valid = []
+        for row_number, row in rows:
+            if not row.get('name'):
+                result.skip(row_number, 'нет названия')
+                continue
+            valid.append((row_number, row, clean_slug(Category, row.get('slug'))))
+
+        existing = {category.name: category for category in Category.objects.filter(name__in=[row['name'] for _, row, _ in valid])}
+        # Занятые слаги -> название категории, которой они принадлежат
+        taken = dict(Category.objects.filter(slug__in=[slug for _, _, slug in valid if slug]).values_list('slug', 'name'))
+        to_create = []
+        to_update = []
+        for row_number, row, slug in valid:
+            category = existing.get(row['name'])
+            if category is None:
+                if slug and taken.setdefault(slug, row['name']) != row['name']:
+                    # Занятый слаг заменяется уникальным слагом по названию (CategoryQuerySet.bulk_create)
+                    slug = ''
+                category = Category(name=row['name'], slug=slug)
+                existing[row['name']] = category
+                to_create.append(category)
+            elif category.pk is None:
+                result.skip(row_number, f'категория {row["name"]!r} уже встречалась в файле')
+            elif slug and slug != category.slug:
+                if taken.setdefault(slug, category.name) != category.name:
+                    result.skip(row_number, f'слаг {slug!r} занят категорией {taken[slug]!r}')
+                    continue
+                category.slug = slug
+                to_update.append(category)
+
+        Category.objects.bulk_update(to_update, ['slug'])
+        Category.objects.bulk_create(to_create)
+        result.created += len(to_create)
+        result.updated += len(to_update)
+
+
+class StoryTransfer(Transfer):
+    """Рассказы сопоставляются по слагу: существующие обновляются, остальные создаются"""
+    model = Story
+    columns = {
+        'slug': 'slug',
+        'title': 'title',
+        'author': 'author__username',
+        'category': 'category__name',
+        'status': 'status',
+        'excerpt': 'excerpt',
+        'content': 'content',
+        'published_at': 'published_at',
+    }
+    update_fields = [
+        'title', 'author', 'category', 'status', 'excerpt', 'content', 'published_at', 'updated_at',
+        *Story.RENDERED_FIELDS,
+    ]
+
+    def import_rows(self, rows, chunk_size=CHUNK_SIZE):
+        # Объекты, чьи части карты сайта нужно пересобрать: {раздел: {pk, ...}}
+        self.sitemap_pks = {section: set() for section in sitemaps.SECTIONS}
+        try:
+            return super().import_rows(rows, chunk_size)
+        finally:
+            if self.sitemap_pks['stories']:
+                run_in_background(sitemaps.update_shards, self.sitemap_pks)
+
+    def touch_sitemap(self, story):
+        self.sitemap_pks['stories'].add(story.pk)
+        self.sitemap_pks['authors'].add(story.author_id)
+        self.sitemap_pks['categories'].add(story.category_id)
+
+    def import_chunk(self, rows, result):
+        authors = get_users(row.get('author') for _, row in rows)
+        categories = get_or_create_categories(row.get('category') for _, row in rows)
+        # Рассказы сопоставляются уже по приведённому слагу
+        slugs = {row_number: clean_slug(Story, row.get('slug')) for row_number, row in rows}
+        existing = {story.slug: story for story in Story.objects.filter(slug__in=set(slugs.values()) - {''})}
+        now = timezone.now()
+
+        to_create = []
+        to_update = {}
+        for row_number, row in rows:
+            if not row.get('title') or not row.get('content'):
+                result.skip(row_number, 'нет заголовка или содержания')
+                continue
+            author = authors.get(row.get('author'))
+            if author is None:
+                result.skip(row_number, f'нет пользователя {row.get("author")!r}')
+                continue
+            status = row.get('status') or Story.Status.DRAFT
+            if status not in Story.Status.values:
+                result.skip(row_number, f'неизвестный статус {status!r}')
+                continue
+            try:
+                published_at = parse_date(row.get('published_at'))
+            except ValueError as e:
+                result.skip(row_number, str(e))
+                continue
+
+            story = existing.get(slugs[row_number])
+            if story is None:
+                story = Story(slug=slugs[row_number])
+                to_create.append(story)
+                if story.slug:
+                    existing[story.slug] = story
+            elif story.pk is not None:
+                to_update[story.pk] = story
+                # bulk_update не выставляет auto_now, а от updated_at зависят карточки и lastmod
+                story.updated_at = now
+                # Прежние автор и категория тоже теряют рассказ
+                self.touch_sitemap(story)
+            story.title = row['title']
+            story.content = row['content']
+            story.excerpt = row.get('excerpt') or ''
+            story.author = author
+            story.category = categories.get(row.get('category'))
+            story.status = status
+            story.published_at = published_at
+            story.prepare_for_bulk()
+
+        # Слаги новых рассказов выделяются одним запросом внутри bulk_create
+        created = Story.objects.bulk_create(to_create)
+        Story.objects.bulk_update(to_update.values(), self.update_fields)
+        search.index_stories(Story, [story.pk for story in created] + list(to_update))
+        for story in [*created, *to_update.values()]:
+            self.touch_sitemap(story)
+        if to_update:
+            caching.bump_story_versions(to_update)
+        result.created += len(created)
+        result.updated += len(to_update)
+
+
+class CommentTransfer(Transfer):
+    """Комментарии только добавляются: естественного ключа у них нет"""
+    model = Comment
+    columns = {
+        'story': 'story__slug',
+        'author': 'author__username',
+        'content': 'content',
+        'is_active': 'is_active',
+        'created_at': 'created_at',
+    }
+
+    def import_chunk(self, rows, result):
+        authors = get_users(row.get('author') for _, row in rows)
+        stories = dict(
+            Story.objects.filter(slug__in={row.get('story') for _, row in rows}).values_list('slug', 'pk')
+        )
+
+        comments = []
+        created_at = []
+        for row_number, row in rows:
+            story_id = stories.get(row.get('story'))
+            author = authors.get(row.get('author'))
+            if story_id is None or author is None or not row.get('content'):
+                result.skip(row_number, 'нет рассказа, автора или текста')
+                continue
+            try:
+                created_at.append(parse_date(row.get('created_at')))
+            except ValueError as e:
+                result.skip(row_number, str(e))
+                continue
+            comments.append(Comment(
+                story_id=story_id, author=author, content=row['content'], is_active=parse_bool(row.get('is_active')),
+            ))
+
+        Comment.objects.bulk_create(comments)
+        # auto_now_add перезаписывает дату при вставке, исходную возвращаем отдельно
+        dated = []
+        for comment, value in zip(comments, created_at):
+            if value is not None:
+                comment.created_at = value
+                dated.append(comment)
+        Comment.objects.bulk_update(dated, ['created_at'])
+
+        per_story = {}
+        for comment in comments:
+            if comment.is_active:
+                per_story[comment.story_id] = per_story.get(comment.story_id, 0) + 1
+        change_comment_counts(per_story)
+        if not all(comment.is_active for comment in comments):
+            caching.forget_moderation_count()
+        result.created += len(comments)
+
+
+TRANSFERS = {
+    Story: StoryTransfer,
+    Category: CategoryTransfer,
+    Comment: CommentTransfer,
+}
@@ -1,18 +1,31 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views, feeds, sitemaps
 
 app_name = 'blog'
 
+# Страницы для чтения под ASGI обслуживают асинхронные версии (blog.async_views)
+public_views = async_views if settings.ASYNC_VIEWS else views
+
 urlpatterns = [
-    path('', views.StoryListView.as_view(), name='story_list'),
-    path('story/<str:slug>/', views.StoryDetailView.as_view(), name='story_detail'),
+    path('', public_views.StoryListView.as_view(), name='story_list'),
+    path('story/<str:slug>/', public_views.StoryDetailView.as_view(), name='story_detail'),
     path('create/', views.StoryCreateView.as_view(), name='story_create'),
     path('story/<str:slug>/edit/', views.StoryUpdateView.as_view(), name='story_update'),
     path('story/<str:slug>/delete/', views.StoryDeleteView.as_view(), name='story_delete'),
     path('story/<str:slug>/comment/', views.add_comment, name='add_comment'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('profile/edit/', views.profile_edit, name='profile_edit'),
-    path('author/<str:username>/', views.UserStoryListView.as_view(), name='user_stories'),
-    path('category/<str:slug>/', views.CategoryStoryListView.as_view(), name='category_stories'),
+    path('author/<str:username>/', public_views.UserStoryListView.as_view(), name='user_stories'),
+    path('category/<str:slug>/', public_views.CategoryStoryListView.as_view(), name='category_stories'),
     path('story/<str:slug>/like/', views.toggle_like, name='story_like'),
+    path('story/<str:slug>/like/api/', views.like_api, name='story_like_api'),
+    path('feed/rss/', feeds.story_rss, name='story_feed_rss'),
+    path('feed/atom/', feeds.story_atom, name='story_feed_atom'),
+    path('category/<str:slug>/feed/rss/', feeds.category_rss, name='category_feed_rss'),
+    path('category/<str:slug>/feed/atom/', feeds.category_atom, name='category_feed_atom'),
+    path('author/<str:username>/feed/rss/', feeds.author_rss, name='author_feed_rss'),
+    path('author/<str:username>/feed/atom/', feeds.author_atom, name='author_feed_atom'),
+    path('sitemap.xml', sitemaps.sitemap_index, name='sitemap'),
+    path('sitemap-<str:section>-<int:number>.xml', sitemaps.sitemap_shard, name='sitemap_shard'),
 ]
@@ -1,6 +1,11 @@
 from django.core.exceptions import ValidationError 
 from django.core.validators import FileExtensionValidator
 from django.utils.deconstruct import deconstructible
+from PIL import Image
+
+
+ALLOWED_IMAGE_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+MAX_IMAGE_PIXELS = 40_000_000
 
 @deconstructible
 class FileSizeValidator:
@@ -23,4 +28,27 @@ def validate_image_extension(value):
         allowed_extensions=['jpg', 'jpeg', 'png', 'webp'],
         message='Поддерживаются только форматы: JPG, JPEG, PNG, WEBP'
     )
-    return validator(value)
\ No newline at end of file
+    return validator(value)
+
+
+def validate_image_content(value):
+    """Проверяет сам файл, а не расширение: формат, целостность и число пикселей"""
+    if getattr(value, '_committed', False):
+        # Уже сохранённый файл проверялся при загрузке
+        return
+    try:
+        value.seek(0)
+        with Image.open(value) as image:
+            image_format = image.format
+            width, height = image.size
+            image.verify()
+    except Image.DecompressionBombError:
+        raise ValidationError('Изображение слишком большое.')
+    except Exception:
+        raise ValidationError('Файл повреждён или не является изображением.')
+    finally:
+        value.seek(0)
+    if image_format not in ALLOWED_IMAGE_FORMATS:
+        raise ValidationError('Поддерживаются только форматы: JPG, JPEG, PNG, WEBP')
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ValidationError(f'Изображение слишком большое: {width}x{height} пикселей.')
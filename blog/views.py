@@ -4,77 +4,79 @@ from django.views.generic import ListView, DetailView, CreateView, UpdateView, D
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Story, Category, Like
+from .models import Story, Category
 from .forms import StoryForm, CommentForm
 from django.views import View
 from .forms import UserRegisterForm, UserEditForm, ProfileEditForm
-from django.db.models import Count, Q
+from .search import search_stories
+from .counters import change_comment_counts, add_like, remove_like
+from .caching import (
+    LISTING_TTL, listing_cache_prefix, story_cache_prefix, listing_cache_key, listing_version, story_version,
+)
+from .page_cache import cache_page_for_anonymous, conditional_page
+from .pagination import KeysetPaginationMixin
+from django.db.models import Sum
 from django.contrib.auth.models import User
-from django.views.decorators.http import require_POST
-from django.core.cache import cache
+from django.views.decorators.http import require_POST, require_http_methods
+from django.http import JsonResponse
 from django.core.paginator import Paginator
 from django_ratelimit.decorators import ratelimit
-from django.views.decorators.cache import cache_page
 from django.utils.decorators import method_decorator
 
 
-@method_decorator(cache_page(60 * 5), name='dispatch')
-class StoryListView(ListView):
+@method_decorator(
+    [conditional_page(listing_version), cache_page_for_anonymous(LISTING_TTL, listing_cache_prefix)], name='dispatch'
+)
+class StoryListView(KeysetPaginationMixin, ListView):
     model = Story
     template_name = 'blog/story_list.html'
     context_object_name = 'stories'
     paginate_by = 6
 
+    def use_keyset_pagination(self):
+        # Результаты поиска отсортированы по релевантности, для них обычная пагинация
+        return not self.request.GET.get('q', '').strip()
+
+    def get_count_cache_key(self):
+        return listing_cache_key('count:all')
+
     def get_queryset(self):
         query = self.request.GET.get('q')
-        queryset = Story.objects.filter(status=Story.Status.PUBLISHED).annotate(like_count=Count('likes')).select_related('author', 'category')
-        if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(content__icontains=query) |
-                Q(author__username__icontains=query)
-            )
+        queryset = Story.published.for_cards()
+        if query and query.strip():
+            return search_stories(queryset, query)
         return queryset.order_by('-published_at', '-pk')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        featured_story = Story.objects.filter(status=Story.Status.PUBLISHED).order_by('-published_at').first()
+        featured_story = Story.published.for_cards().order_by('-published_at', '-pk').first()
         context['featured_story'] = featured_story
         return context
     
 
-@method_decorator(cache_page(60 * 3), name='dispatch')    
+@method_decorator(
+    [conditional_page(story_version), cache_page_for_anonymous(60 * 3, story_cache_prefix)], name='dispatch'
+)
 class StoryDetailView(DetailView):
     model = Story
     template_name = 'blog/story_detail.html'
     context_object_name = 'story'
 
     def get_queryset(self):
-        return Story.objects.filter(status=Story.Status.PUBLISHED).select_related('author', 'category')
+        # Исходный Markdown не нужен: страница выводит сохранённый content_html
+        return Story.published.select_related('author__profile', 'category').defer('content')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        story = self.get_object()
+        story = self.object
         comments_list = story.comments.filter(is_active=True).select_related('author__profile')
         paginator = Paginator(comments_list, 10)
         page_number = self.request.GET.get('page')
         comments = paginator.get_page(page_number)
 
         context['comments'] = comments
-        context['comment_form'] = CommentForm()
-        
-        cache_key = f'story_likes_{story.pk}'
-        like_count = cache.get(cache_key)
-        if like_count is None:
-            like_count = story.likes.count()
-            cache.set(cache_key, like_count, 300)
-
-        context['like_count'] = like_count
-        
-        if self.request.user.is_authenticated:
-            context['user_likes'] = story.likes.filter(user=self.request.user).exists()
-        else:
-            context['user_likes'] = False
+        # Состояние лайка и форма комментария рендерятся фрагментами (blog.page_cache)
+        context['like_count'] = story.like_count
         return context
 
 
@@ -133,6 +135,8 @@ def add_comment(request, slug):
         comment.story = story
         comment.author = request.user
         comment.save()
+        if comment.is_active:
+            change_comment_counts({story.pk: 1})
         messages.success(request, "Ваш комментарий добавлен и будет опубликован после проверки модератором.")
     else:
         messages.error(request, "Ошибка при добавлении комментария.")
@@ -158,9 +162,10 @@ class RegisterView(View):
 
 @login_required
 def dashboard(request):
-    user_stories = Story.objects.filter(author=request.user).annotate(
-        comment_count=Count('comments'),
-        like_count=Count('likes')
+    user_stories = Story.objects.filter(author=request.user).without_content().select_related('category')
+    totals = user_stories.filter(status=Story.Status.PUBLISHED).aggregate(
+        total_likes=Sum('like_count'),
+        total_comments=Sum('active_comment_count')
     )
 
     drafts = user_stories.filter(status=Story.Status.DRAFT).order_by('-updated_at')
@@ -169,7 +174,8 @@ def dashboard(request):
     context = {
         'drafts': drafts,
         'published': published,
-        'profile': request.user.profile
+        'profile': request.user.profile,
+        **totals
     }
     return render(request, 'blog/dashboard.html', context)
 
@@ -198,32 +204,45 @@ def profile_edit(request):
     return render(request, 'blog/profile_edit.html', context)
 
 
-class UserStoryListView(ListView):
+@method_decorator(conditional_page(listing_version), name='dispatch')
+class UserStoryListView(KeysetPaginationMixin, ListView):
     model = Story
     template_name = 'blog/user_stories.html'
     context_object_name = 'stories'
     paginate_by = 5
 
+    def get_count_cache_key(self):
+        return listing_cache_key(f'count:author:{self.author.pk}')
+
     def get_queryset(self):
         self.author = get_object_or_404(User, username=self.kwargs['username'])
-        return Story.objects.filter(author=self.author, status=Story.Status.PUBLISHED).order_by('-published_at')
+        return Story.published.for_cards().filter(author=self.author).order_by('-published_at', '-pk')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['author'] = self.author
+        context.update(Story.published.filter(author=self.author).aggregate(
+            total_likes=Sum('like_count'),
+            total_comments=Sum('active_comment_count')
+        ))
         return context
     
 
-@method_decorator(cache_page(60 * 5), name='dispatch')
-class CategoryStoryListView(ListView):
+@method_decorator(
+    [conditional_page(listing_version), cache_page_for_anonymous(LISTING_TTL, listing_cache_prefix)], name='dispatch'
+)
+class CategoryStoryListView(KeysetPaginationMixin, ListView):
     model = Story
     template_name = 'blog/category_stories.html'
     context_object_name = 'stories'
     paginate_by = 5
 
+    def get_count_cache_key(self):
+        return listing_cache_key(f'count:category:{self.category.pk}')
+
     def get_queryset(self):
         self.category = get_object_or_404(Category, slug=self.kwargs['slug'])
-        return Story.objects.filter(category=self.category, status=Story.Status.PUBLISHED).order_by('-published_at')
+        return Story.published.for_cards().filter(category=self.category).order_by('-published_at', '-pk')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -235,6 +254,7 @@ class CategoryStoryListView(ListView):
 @login_required
 @require_POST
 def toggle_like(request, slug):
+    """Переключение лайка формой, без JavaScript"""
     if getattr(request, 'limited', False):
         messages.warning(request, "Слишком много действий. Подождите немного перед следующим лайком.")
         return redirect('blog:story_detail', slug=slug)
@@ -244,14 +264,35 @@ def toggle_like(request, slug):
         status=Story.Status.PUBLISHED
     )
 
-    like, created = Like.objects.get_or_create(story=story, user=request.user)
-    if not created:
-        like.delete()
-        messages.info(request, 'Лайк удалён.')
-    else:
+    if add_like(story.pk, request.user):
         messages.success(request, 'Вы поставили лайк!')
-        
-    cache_key = f'story_likes_{story.pk}'
-    cache.delete(cache_key)
+    else:
+        remove_like(story.pk, request.user)
+        messages.info(request, 'Лайк удалён.')
+
+    return redirect('blog:story_detail', slug=slug)
 
-    return redirect('blog:story_detail', slug=slug)
\ No newline at end of file
+
+@ratelimit(key='user_or_ip', rate='10/m', method=['PUT', 'DELETE'], block=False)
+@require_http_methods(['PUT', 'DELETE'])
+def like_api(request, slug):
+    """
+    PUT ставит лайк, DELETE снимает. Запросы идемпотентны: повторный PUT или
+    DELETE ничего не меняет. Ответ — состояние лайка и число лайков рассказа.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Войдите, чтобы ставить лайки.'}, status=401)
+    if getattr(request, 'limited', False):
+        return JsonResponse(
+            {'error': 'Слишком много действий. Подождите немного перед следующим лайком.'}, status=429
+        )
+    story = Story.published.filter(slug=slug).values('pk', 'like_count').first()
+    if story is None:
+        return JsonResponse({'error': 'Рассказ не найден.'}, status=404)
+
+    liked = request.method == 'PUT'
+    changed = add_like(story['pk'], request.user) if liked else remove_like(story['pk'], request.user)
+    like_count = story['like_count']
+    if changed:
+        like_count = Story.objects.filter(pk=story['pk']).values_list('like_count', flat=True).first()
+    return JsonResponse({'liked': liked, 'like_count': like_count})
@@ -0,0 +1,40 @@
+// Лайк без перезагрузки страницы: форма кнопки отправляется в JSON API
+// (PUT — поставить, DELETE — снять). Без JavaScript работает обычная форма.
+document.addEventListener('submit', async (event) => {
+  const form = event.target.closest('form[data-like-api]');
+  if (!form) {
+    return;
+  }
+  event.preventDefault();
+
+  const button = form.querySelector('button');
+  const liked = form.dataset.liked === 'true';
+  button.disabled = true;
+  try {
+    const response = await fetch(form.dataset.likeApi, {
+      method: liked ? 'DELETE' : 'PUT',
+      headers: {
+        'X-CSRFToken': form.querySelector('[name=csrfmiddlewaretoken]').value,
+        'Accept': 'application/json',
+      },
+      credentials: 'same-origin',
+    });
+    const data = await response.json();
+    if (!response.ok) {
+      alert(data.error);
+      return;
+    }
+    form.dataset.liked = data.liked;
+    button.classList.toggle('btn-danger', data.liked);
+    button.classList.toggle('btn-outline-danger', !data.liked);
+    const icon = button.querySelector('.bi');
+    icon.classList.toggle('bi-heart-fill', data.liked);
+    icon.classList.toggle('bi-heart', !data.liked);
+    form.querySelector('[data-like-count]').textContent = data.like_count;
+  } catch (error) {
+    // Сеть или сервер недоступны — отправляем форму как раньше
+    form.submit();
+  } finally {
+    button.disabled = false;
+  }
+});
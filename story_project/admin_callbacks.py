@@ -1,7 +1,6 @@
 """Callback функции для Unfold Admin"""
 import os
-from blog.models import Story, Comment, Like
-from django.contrib.auth.models import User
+from blog.stats import get_dashboard_stats
 
 
 def environment_callback(request):
@@ -16,13 +15,9 @@ def environment_callback(request):
 
 def dashboard_callback(request, context):
     """Добавляет статистику на dashboard"""
+    stats = get_dashboard_stats()
     context.update({
-        "stats": {
-            "stories": Story.objects.filter(status=Story.Status.PUBLISHED).count(),
-            "drafts": Story.objects.filter(status=Story.Status.DRAFT).count(),
-            "comments": Comment.objects.filter(is_active=True).count(),
-            "users": User.objects.count(),
-            "total_likes": Like.objects.count(),
-        }
+        "stats": stats['counters'],
+        "daily_stats": stats['daily'],
     })
     return context
@@ -52,6 +52,8 @@ INSTALLED_APPS = [
     'blog',
     'imagekit',
     'markdownx',
+    # Приложение нужно ради системных проверок кеша (django_ratelimit.E003)
+    'django_ratelimit',
 ]
 
 MIDDLEWARE = [
@@ -99,13 +101,43 @@ DATABASES = {
     }
 }
 
-CACHES = {
-    'default': {
+# Cache
+# Кеш должен быть общим для всех воркеров gunicorn: версии рассказов,
+# кеш страниц и лимиты django-ratelimit хранятся в нём.
+# CACHE_URL: redis://host:6379/0 — Redis, file:///path — файловый кеш,
+# пусто — локальный кеш процесса (разработка и тесты). Лимитам нужен атомарный
+# incr в общем кеше, поэтому в production допускается только Redis (prod.py).
+
+def build_cache_config(url):
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': url,
+            'KEY_PREFIX': 'story',
+        }
+    if url.startswith('file://'):
+        return {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': url[len('file://'):],
+            'KEY_PREFIX': 'story',
+        }
+    return {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
     }
+
+
+CACHE_URL = os.getenv('CACHE_URL', '')
+
+CACHES = {
+    'default': build_cache_config(CACHE_URL),
 }
 
+# Ленивая подгрузка текста рассказа в списках (см. Story.refresh_from_db):
+# warn — предупреждение, raise — исключение, off — без проверки.
+# Не задано — предупреждение только при DEBUG.
+DEFERRED_CONTENT_GUARD = os.getenv('DEFERRED_CONTENT_GUARD')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -161,6 +193,16 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 CKEDITOR_UPLOAD_PATH = "uploads/"
 
+# Миниатюры создаются в фоне после загрузки, а не при первом показе (blog.imagegenerators)
+IMAGEKIT_DEFAULT_CACHEFILE_STRATEGY = 'blog.imagegenerators.BackgroundOptimistic'
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', '2'))
+
+# Асинхронные версии публичных страниц (blog.async_views); включать при запуске под ASGI
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+
+# Адрес сайта для абсолютных ссылок вне запроса (карта сайта, blog.sitemaps)
+SITE_BASE_URL = os.getenv('SITE_BASE_URL', 'http://localhost:8000')
+
 
 LOGIN_REDIRECT_URL = 'blog:story_list'
 LOGIN_URL = 'login'
@@ -179,6 +221,8 @@ MARKDOWNX_MEDIA_PATH = 'markdownx/'
 
 RATELIMIT_ENABLE = True
 RATELIMIT_USE_CACHE = 'default'
+# RedisCache из Django нет в списке django-ratelimit, но INCR в Redis атомарный
+SILENCED_SYSTEM_CHECKS = ['django_ratelimit.W001']
 
 
 UNFOLD = {
@@ -11,3 +11,6 @@ DATABASES = {
     }
 }
 
+# Локальный кеш процесса не общий для воркеров: для разработки и тестов лимиты
+# django-ratelimit в одном процессе достаточны
+SILENCED_SYSTEM_CHECKS = [*SILENCED_SYSTEM_CHECKS, 'django_ratelimit.E003']
@@ -37,6 +37,11 @@ DATABASES = {
     }
 }
 
+# Общий кеш для всех воркеров и серверов. Файловый кеш не подходит:
+# у него нет атомарного incr, и лимиты django-ratelimit перестают работать
+if not CACHE_URL.startswith(('redis://', 'rediss://', 'unix://')):
+    raise Exception("CACHE_URL должен указывать на Redis в production!")
+
 # Настройки для статических файлов
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 